@@ -0,0 +1,298 @@
+# backend/answer_cache.py
+"""rag_search 앞단의 답변 캐시.
+
+- 키: 정규화 쿼리 + file_name + category + answer_lang (temperature=0 이므로 같은 키 = 같은 답변)
+- TTL + 크기 기반(LRU) 만료
+- 동시에 들어온 같은 키의 요청은 하나의 계산으로 합친다 (request coalescing)
+  스트리밍 요청은 StreamFeed로 같은 생성의 토큰을 도착하는 대로 함께 받는다
+- semantic 모드(선택): 같은 파일/카테고리/언어에서 쿼리 임베딩 코사인 유사도가 임계값 이상이면 재사용
+- 계약서 청크를 다시 적재하면 invalidate_file로 해당 파일 항목을 무효화한다
+"""
+import asyncio
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def normalize_question(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join(text.split()).rstrip("?.!。？ ")
+
+
+class StreamAbandoned(Exception):
+    """스트리밍 생성이 결과 없이 끝났다 (구독자가 모두 연결을 끊음). 기다리던 요청은 직접 계산한다."""
+
+
+class StreamFeed:
+    """스트리밍 생성 하나를 여러 요청이 함께 받는다.
+
+    생성은 별도 태스크(task)가 하고, 이벤트는 구독자마다 큐로 나눠 준다.
+    늦게 합류한 구독자는 지난 이벤트부터 차례로 받는다. 마지막 이벤트는 "done" 또는 "error".
+    """
+
+    def __init__(self):
+        self.events: list[tuple[str, object]] = []
+        self.task: asyncio.Future | None = None
+        self._queues: list[asyncio.Queue] = []
+
+    def publish(self, event: str, payload) -> None:
+        self.events.append((event, payload))
+        for queue in self._queues:
+            queue.put_nowait((event, payload))
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for item in self.events:
+            queue.put_nowait(item)
+        self._queues.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> bool:
+        """구독을 끊는다. 마지막 구독자가 떠났고 생성이 아직 진행 중이면 True."""
+        self._queues.remove(queue)
+        return not self._queues and self.task is not None and not self.task.done()
+
+
+class _Entry:
+    __slots__ = ("result", "expires_at", "vector")
+
+    def __init__(self, result: dict, expires_at: float, vector):
+        self.result = result
+        self.expires_at = expires_at
+        self.vector = vector
+
+
+class AnswerCache:
+    def __init__(self, ttl: float = 600.0, max_entries: int = 512, semantic: bool = False, threshold: float = 0.97):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        # 파일별 세대 번호: 계산 도중 무효화되면 낡은 결과를 저장하지 않는다
+        self._generations: dict[str | None, int] = {}
+        self._inflight: dict[tuple, Future] = {}
+        self._ainflight: dict[tuple, asyncio.Future] = {}
+        self._streams: dict[tuple, StreamFeed] = {}
+        self.hits = 0
+        self.semantic_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(query: str, file_name=None, category=None, answer_lang="ko", top_k: int = 5) -> tuple:
+        return (normalize_question(query), file_name, category, answer_lang, top_k)
+
+    # --- 조회/저장 -------------------------------------------------------
+    def _get_locked(self, key: tuple, vector) -> dict | None:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.result
+            del self._entries[key]
+        if self.semantic and vector is not None:
+            best, best_score = None, self.threshold
+            for other_key, other in self._entries.items():
+                if other_key[1:] != key[1:] or other.vector is None or other.expires_at <= now:
+                    continue
+                score = float(np.dot(vector, other.vector))
+                if score >= best_score:
+                    best, best_score = other, score
+            if best is not None:
+                self.semantic_hits += 1
+                return best.result
+        return None
+
+    def get(self, key: tuple, query_vector=None) -> dict | None:
+        if not self.enabled:
+            return None
+        vector = self._unit(query_vector)
+        with self._lock:
+            return self._get_locked(key, vector)
+
+    def put(self, key: tuple, result: dict, query_vector=None, generation: int | None = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation(key[1]):
+                return
+            self._entries[key] = _Entry(result, time.monotonic() + self.ttl, self._unit(query_vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _unit(self, vector):
+        if not self.semantic or vector is None:
+            return None
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(arr))
+        return arr / norm if norm else None
+
+    def generation(self, file_name) -> int:
+        # 전체 계약서(file_name=None) 검색 결과는 어느 파일이 바뀌어도 낡을 수 있다
+        if file_name is None:
+            return sum(self._generations.values())
+        return self._generations.get(file_name, 0) + self._generations.get(None, 0)
+
+    # --- 요청 합치기 -----------------------------------------------------
+    def get_or_compute(self, key: tuple, compute, query_vector=None) -> dict:
+        """동기 버전. 같은 키로 계산 중인 요청이 있으면 그 결과를 기다린다."""
+        if not self.enabled:
+            return compute()
+        vector = self._unit(query_vector)
+        with self._lock:
+            cached = self._get_locked(key, vector)
+            if cached is not None:
+                return cached
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Future()
+                generation = self.generation(key[1])
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+        if not leader:
+            return pending.result()
+        try:
+            result = compute()
+            self.put(key, result, query_vector, generation)
+            pending.set_result(result)
+            return result
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_compute(self, key: tuple, compute, query_vector=None) -> dict:
+        """비동기 버전. compute는 코루틴을 반환하는 호출 가능 객체.
+
+        계산은 별도 태스크로 실행되므로 먼저 요청한 클라이언트가 끊겨도
+        같은 키를 기다리는 다른 요청은 결과를 받는다.
+        """
+        if not self.enabled:
+            return await compute()
+        vector = self._unit(query_vector)
+        while True:
+            with self._lock:
+                cached = self._get_locked(key, vector)
+                if cached is not None:
+                    return cached
+                task = self._ainflight.get(key)
+                if task is None:
+                    generation = self.generation(key[1])
+                    task = self._ainflight[key] = asyncio.ensure_future(compute())
+                    task.add_done_callback(lambda t: self._finish(key, t, query_vector, generation))
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+            try:
+                return await asyncio.shield(task)
+            except StreamAbandoned:
+                continue  # 기다리던 스트림이 중단됨: 다시 조회해 직접 계산한다
+
+    def _finish(self, key: tuple, task: asyncio.Future, query_vector, generation: int) -> None:
+        with self._lock:
+            self._ainflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result(), query_vector, generation)
+
+    def join_stream(self, key: tuple, produce, query_vector=None):
+        """스트리밍용 조회. (캐시 결과, 기다릴 일반 계산, 구독할 StreamFeed) 중 하나만 채워 반환한다.
+
+        같은 키를 스트리밍 중인 요청이 있으면 그 피드를, 없으면 produce(feed)로 생성을 시작한 새 피드를 준다.
+        생성 결과는 aget_or_compute와 같은 자리에 등록되므로 일반 요청도 함께 기다린다.
+        피드를 받은 쪽은 끝나거나 중단될 때 leave_stream을 호출해야 한다.
+        """
+        vector = self._unit(query_vector)
+        with self._lock:
+            if self.enabled:
+                cached = self._get_locked(key, vector)
+                if cached is not None:
+                    return cached, None, None
+                feed = self._streams.get(key)
+                if feed is not None:
+                    self.coalesced += 1
+                    return None, None, feed
+                pending = self._ainflight.get(key)
+                if pending is not None:
+                    self.coalesced += 1
+                    return None, pending, None
+                self.misses += 1
+            feed = StreamFeed()
+            future = asyncio.get_running_loop().create_future()
+            generation = self.generation(key[1])
+            if self.enabled:
+                self._streams[key] = feed
+                self._ainflight[key] = future
+        feed.task = asyncio.ensure_future(produce(feed))
+        feed.task.add_done_callback(lambda t: self._finish_stream(key, feed, future, query_vector, generation))
+        return None, None, feed
+
+    def _unregister_stream(self, key: tuple, feed: "StreamFeed") -> None:
+        with self._lock:
+            if self._streams.get(key) is feed:
+                del self._streams[key]
+                self._ainflight.pop(key, None)
+
+    def _finish_stream(self, key: tuple, feed: "StreamFeed", future: asyncio.Future, query_vector, generation: int) -> None:
+        self._unregister_stream(key, feed)
+        task = feed.task
+        error = StreamAbandoned() if task.cancelled() else task.exception()
+        if error is None:
+            result = task.result()
+            self.put(key, result, query_vector, generation)
+            future.set_result(result)
+            feed.publish("done", result)
+        else:
+            future.set_exception(error)
+            future.exception()  # 기다리는 요청이 없어도 "never retrieved" 경고를 남기지 않는다
+            feed.publish("error", error)
+
+    async def leave_stream(self, key: tuple, feed: "StreamFeed", queue: asyncio.Queue) -> None:
+        """구독을 끊는다. 마지막 구독자였고 생성이 진행 중이면 생성을 취소하고 끝날 때까지 기다린다."""
+        if not feed.unsubscribe(queue):
+            return
+        # 새 요청이 취소 중인 피드에 합류하지 않도록 먼저 등록을 지운다
+        self._unregister_stream(key, feed)
+        feed.task.cancel()
+        await asyncio.wait([feed.task])
+
+    # --- 무효화/통계 -----------------------------------------------------
+    def invalidate_file(self, file_name: str | None) -> int:
+        """file_name의 항목과 전체 계약서 검색 항목을 지운다. file_name=None이면 전부 지운다."""
+        with self._lock:
+            self._generations[file_name] = self._generations.get(file_name, 0) + 1
+            if file_name is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            stale = [k for k in self._entries if k[1] in (file_name, None)]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
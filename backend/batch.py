@@ -0,0 +1,174 @@
+# backend/batch.py
+"""한 계약서에 대한 질문 목록(실사 체크리스트)을 한 번에 처리한다.
+
+    async for item in abatch_rag_search(questions, file_name="JOA.pdf"):
+        item  # {"index": 3, "question": ..., "answer": ...} 또는 {"index": 7, "question": ..., "error": ...}
+
+- 임베딩: 캐시에 없는 질문만 모아 embed_documents 한 번으로 보낸다
+- 같은 질문(answer_cache 정규화 기준)은 검색/생성을 한 번만 하고 결과를 나눠 쓴다
+- 생성: 동시 실행 상한(BATCH_CONCURRENCY)과 분당 요청 상한(BATCH_RPM) 안에서 실행하고,
+  429/5xx/타임아웃은 지수 백오프로 재시도한다
+- 결과는 끝나는 순서대로 내보내며, 실패한 질문은 해당 항목에만 error로 표시한다
+"""
+import asyncio
+import os
+import random
+import time
+
+from . import rag
+from .answer_cache import normalize_question
+from .instrumentation import stage
+from .lexical import parse_clause_reference
+
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "8"))
+BATCH_RPM = float(os.getenv("RAG_BATCH_RPM", "0"))  # 0이면 제한 없음
+BATCH_MAX_RETRIES = int(os.getenv("RAG_BATCH_MAX_RETRIES", "3"))
+BATCH_BACKOFF = float(os.getenv("RAG_BATCH_BACKOFF", "1.0"))
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """분당 요청 수 상한 (토큰 버킷). rate_per_minute <= 0이면 제한하지 않는다."""
+
+    def __init__(self, rate_per_minute: float, burst: int | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 60) or 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    # openai SDK를 직접 임포트하지 않고 상태 코드/예외 종류로 판단한다
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status in _RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def with_retries(call, limiter: RateLimiter, max_retries: int = BATCH_MAX_RETRIES, backoff: float = BATCH_BACKOFF):
+    """call()을 실행하고 재시도 가능한 오류면 backoff * 2^n (+지터, Retry-After 우선) 뒤 다시 시도한다."""
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e) or backoff * (2 ** attempt)
+            await asyncio.sleep(delay * (1 + random.random() * 0.25))
+
+
+def _error_item(index: int, question, file_name: str, error: Exception) -> dict:
+    return {
+        "index": index,
+        "question": question,
+        "file": file_name,
+        "error": str(error) or type(error).__name__,
+        "error_type": type(error).__name__,
+    }
+
+
+async def abatch_rag_search(
+    questions: list[str],
+    file_name: str,
+    category=None,
+    answer_lang="ko",
+    top_k=5,
+    llm=None,
+    concurrency: int = BATCH_CONCURRENCY,
+    rpm: float = BATCH_RPM,
+    max_retries: int = BATCH_MAX_RETRIES,
+):
+    """질문별 결과를 끝나는 순서대로 생성한다. 각 항목에는 원래 순서의 index가 붙는다.
+
+    빈 질문은 번호를 그대로 둔 채 해당 항목만 오류로 먼저 보낸다.
+    소비자가 중간에 aclose() 하면 남은 작업은 취소된다.
+    """
+    groups: dict[str, list[int]] = {}
+    for i, question in enumerate(questions):
+        if not (question or "").strip():
+            yield _error_item(i, question, file_name, ValueError("empty question"))
+            continue
+        groups.setdefault(normalize_question(question), []).append(i)
+
+    # 조항 번호 직접 조회로 답할 질문은 임베딩하지 않는다
+    to_embed = [
+        questions[indexes[0]] for indexes in groups.values()
+        if not (rag.RETRIEVAL_MODE == "hybrid" and parse_clause_reference(questions[indexes[0]]))
+    ]
+    vectors: dict[str, list[float]] = {}
+    if to_embed:
+        limiter = RateLimiter(rpm)
+        try:
+            # 실패는 rag_stage_errors_total{stage="batch_embed"}로 드러난다
+            with stage("batch_embed"):
+                embedded = await with_retries(
+                    lambda: rag.get_query_embedder().aembed_many(to_embed), limiter, max_retries
+                )
+            vectors = {normalize_question(q): v for q, v in zip(to_embed, embedded)}
+        except Exception:
+            # 일괄 임베딩이 실패해도 질문별 경로(개별 임베딩)로 계속 진행한다
+            pass
+
+    gate = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rpm)
+
+    async def _run(norm: str, indexes: list[int]):
+        question = questions[indexes[0]]
+        async with gate:
+            try:
+                result = await with_retries(
+                    lambda: rag.arag_search(
+                        question,
+                        file_name=file_name,
+                        category=category,
+                        answer_lang=answer_lang,
+                        top_k=top_k,
+                        llm=llm,
+                        query_vector=vectors.get(norm),
+                    ),
+                    limiter,
+                    max_retries,
+                )
+                return indexes, result, None
+            except Exception as e:
+                return indexes, None, e
+
+    tasks = [asyncio.ensure_future(_run(norm, indexes)) for norm, indexes in groups.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indexes, result, error = await next_done
+            for i in indexes:
+                if error is None:
+                    yield {**result, "index": i, "question": questions[i]}
+                else:
+                    yield _error_item(i, questions[i], file_name, error)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,334 @@
+# backend/benchmark.py
+"""ground_truth.xlsx의 질문을 rag_search로 재생해 검색 품질과 지연/처리량을 측정한다.
+
+실행:
+    python -m backend.benchmark --offline --out bench.json        # 가짜 임베딩 + 로컬 인덱스 + 스텁 LLM
+    python -m backend.benchmark --k 5 --concurrency 8 --out bench.json   # 설정된 실제 백엔드
+
+보고 항목 (JSON):
+- quality: nDCG@k, recall@k (정답 = 워크북의 파일/페이지; 페이지가 없으면 청크 본문의 조항 번호)
+- latency_ms: 단계별(embed, vector_query, lexical, prompt_build, llm, total) p50/p95/p99
+- prompt_tokens: 요청당 프롬프트 토큰 수 (mean/p95/max)
+- throughput: 지정한 동시성에서의 req/s
+--retrieval both 로 벡터 단독/하이브리드 검색을 같은 질문으로 비교한다 (결과는 runs.<방식>).
+
+답변 캐시는 기본으로 끈다 (--warm-cache로 켤 수 있음). 같은 질문 반복이 측정을 왜곡하지 않게 하기 위함.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from . import rag
+from .answer_cache import AnswerCache
+from .embedding_cache import QueryEmbeddingCache
+from .instrumentation import record_stages
+from .lexical import LexicalIndex, clause_pattern
+
+GROUND_TRUTH_PATH = os.path.join(rag.DATA_DIR, "ground_truth.xlsx")
+STAGES = ("embed", "vector_query", "lexical", "prompt_build", "llm", "total")
+
+# 워크북 헤더 별칭 (소문자 비교)
+QUESTION_COLUMNS = ("question", "query", "질문", "질의")
+FILE_COLUMNS = ("file_name", "file", "contract", "document", "source", "계약서", "문서", "파일")
+PAGE_COLUMNS = ("pages", "page", "page_num", "페이지", "쪽")
+CLAUSE_COLUMNS = ("clause", "clauses", "article", "section", "조항", "조문")
+
+
+class HashingEmbeddings:
+    """오프라인용 결정적 임베딩: 토큰(영문 단어, 한글 2-gram)을 해시 버킷에 부호와 함께 더한다.
+
+    같은 단어를 공유하는 텍스트끼리 유사도가 높아지므로 검색 품질 비교에 쓸 수 있다.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _tokens(self, text: str) -> list[str]:
+        tokens = re.findall(r"[a-z0-9]+", text.lower())
+        for run in re.findall(r"[가-힣]+", text):
+            tokens.extend(run[i:i + 2] for i in range(max(len(run) - 1, 1)))
+        return tokens
+
+    def _embed(self, text: str) -> list[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in self._tokens(text):
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+# --- 정답 로딩 --------------------------------------------------------------
+def _find_column(header: list[str], aliases: tuple[str, ...], override: str | None) -> int | None:
+    names = [str(h or "").strip().lower() for h in header]
+    aliases = (override.lower(),) if override else aliases
+    # 정확히 일치하는 열을 먼저 찾고, 없을 때만 별칭을 포함하는 열로 넘어간다 ("question_id"보다 "question")
+    for alias in aliases:
+        if alias in names:
+            return names.index(alias)
+    if override:
+        return None
+    for alias in aliases:
+        for i, name in enumerate(names):
+            if alias in name:
+                return i
+    return None
+
+
+def load_ground_truth(path: str, question_col=None, file_col=None, pages_col=None, clause_col=None) -> list[dict]:
+    """첫 번째 시트에서 질문/파일/페이지/조항 열을 찾아 평가 케이스 목록을 만든다."""
+    from openpyxl import load_workbook
+
+    rows = list(load_workbook(path, read_only=True, data_only=True).worksheets[0].iter_rows(values_only=True))
+    for header_idx, header in enumerate(rows):
+        q = _find_column(list(header), QUESTION_COLUMNS, question_col)
+        if q is not None:
+            break
+    else:
+        raise ValueError(f"{path}: no question column (looked for {', '.join(QUESTION_COLUMNS)})")
+    f = _find_column(list(header), FILE_COLUMNS, file_col)
+    p = _find_column(list(header), PAGE_COLUMNS, pages_col)
+    c = _find_column(list(header), CLAUSE_COLUMNS, clause_col)
+
+    cases = []
+    for row in rows[header_idx + 1:]:
+        question = row[q] if q < len(row) else None
+        if not question or not str(question).strip():
+            continue
+        cell = lambda i: str(row[i]).strip() if i is not None and i < len(row) and row[i] is not None else ""
+        cases.append({
+            "question": str(question).strip(),
+            "file_name": cell(f) or None,
+            "pages": sorted({int(n) for n in re.findall(r"\d+", cell(p))}),
+            "clauses": [s.strip() for s in re.split(r"[;,\n]", cell(c)) if s.strip()],
+        })
+    return cases
+
+
+def _resolve_file_names(cases: list[dict], known: list[str]) -> None:
+    # 워크북의 파일명은 확장자/대소문자가 다를 수 있으므로 인덱스의 file_name에 맞춘다
+    by_key = {os.path.splitext(n)[0].lower(): n for n in known}
+    for case in cases:
+        name = case["file_name"]
+        if name:
+            case["file_name"] = by_key.get(os.path.splitext(name)[0].lower(), name)
+
+
+# --- 지표 -------------------------------------------------------------------
+def relevance(case: dict, sources: list[dict], k: int) -> list[int]:
+    """상위 k개 각각이 아직 찾지 못한 정답 단위(페이지 또는 조항)를 맞췄으면 1.
+
+    조항은 청크 전문에서 조항 경계 정규식으로 찾는다 ("7.1"이 "17.1"에 걸리지 않게).
+    """
+    patterns = {cl: clause_pattern(cl) for cl in case["clauses"]}
+    found: set = set()
+    rels = []
+    for source in sources[:k]:
+        unit = None
+        same_file = not case["file_name"] or source["file_name"] == case["file_name"]
+        if case["pages"]:
+            if same_file and source["page_num"] in case["pages"]:
+                unit = source["page_num"]
+        elif case["clauses"]:
+            text = source.get("text") or ""
+            unit = next((cl for cl, pattern in patterns.items() if same_file and pattern.search(text)), None)
+        rels.append(1 if unit is not None and unit not in found else 0)
+        if unit is not None:
+            found.add(unit)
+    return rels
+
+
+def ndcg_at_k(rels: list[int], n_relevant: int, k: int) -> float:
+    dcg = sum(r / math.log2(i + 2) for i, r in enumerate(rels[:k]))
+    ideal = sum(1 / math.log2(i + 2) for i in range(min(n_relevant, k)))
+    return dcg / ideal if ideal else 0.0
+
+
+def _token_stats(values: list) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {}
+    return {"mean": round(float(np.mean(values)), 1), "p95": int(np.percentile(values, 95)), "max": max(values)}
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    arr = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+        "mean": round(float(arr.mean()), 2),
+        "n": len(values),
+    }
+
+
+# --- 실행 -------------------------------------------------------------------
+async def _run_case(case: dict, k: int, llm, gate: asyncio.Semaphore) -> dict:
+    async with gate:
+        with record_stages() as stages:
+            t0 = time.perf_counter()
+            try:
+                result = await rag.arag_search(case["question"], file_name=case["file_name"], top_k=k, llm=llm)
+                error = None
+            except Exception as e:
+                result, error = {}, str(e)
+            stages["total"] = time.perf_counter() - t0
+    return {"case": case, "result": result, "stages": dict(stages), "error": error}
+
+
+async def run_benchmark(cases: list[dict], k: int, concurrency: int, repeat: int, llm=None) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+    t0 = time.perf_counter()
+    runs = await asyncio.gather(*(_run_case(c, k, llm, gate) for _ in range(repeat) for c in cases))
+    elapsed = time.perf_counter() - t0
+
+    per_question, ndcgs, recalls = [], [], []
+    for run in runs[:len(cases)]:
+        case, result = run["case"], run["result"]
+        n_relevant = len(case["pages"]) or len(case["clauses"])
+        entry = {"question": case["question"], "file_name": case["file_name"], "error": run["error"]}
+        if n_relevant and not run["error"]:
+            rels = relevance(case, result.get("sources", []), k)
+            entry["ndcg"] = round(ndcg_at_k(rels, n_relevant, k), 4)
+            entry["recall"] = round(sum(rels) / n_relevant, 4)
+            entry["retrieved"] = [(s["file_name"], s["page_num"]) for s in result.get("sources", [])[:k]]
+            ndcgs.append(entry["ndcg"])
+            recalls.append(entry["recall"])
+        per_question.append(entry)
+
+    ok_runs = [r for r in runs if not r["error"]]
+    return {
+        "quality": {
+            f"ndcg@{k}": round(float(np.mean(ndcgs)), 4) if ndcgs else None,
+            f"recall@{k}": round(float(np.mean(recalls)), 4) if recalls else None,
+            "judged": len(ndcgs),
+            "questions": len(cases),
+            # 조항 번호 직접 조회 등으로 임베딩 없이 답한 요청 수
+            "embedding_skipped": sum(1 for r in ok_runs if "embed" not in r["stages"]),
+        },
+        "prompt_tokens": _token_stats([r["result"].get("prompt_tokens") for r in ok_runs]),
+        "latency_ms": {name: _percentiles([r["stages"][name] for r in ok_runs if name in r["stages"]]) for name in STAGES},
+        "throughput": {
+            "concurrency": concurrency,
+            "requests": len(runs),
+            "errors": len(runs) - len(ok_runs),
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(len(runs) / elapsed, 2) if elapsed else 0.0,
+        },
+        "per_question": per_question,
+    }
+
+
+def setup_offline(workdir: str, pdfs: list[str], llm_latency: float):
+    """가짜 임베딩으로 PDF를 로컬 인덱스에 적재하고 rag의 백엔드를 교체한다. 스텁 LLM을 반환."""
+    from . import ingest
+    from .catalog import DocumentCatalog
+    from .loadtest import StubChatModel
+    from .local_index import LocalVectorIndex
+
+    embeddings = HashingEmbeddings()
+    store = LocalVectorIndex(os.path.join(workdir, "index"))
+    ingest.ingest(
+        pdfs, store=store, embeddings=embeddings,
+        state_path=os.path.join(workdir, "ingest_state.json"),
+        catalog=DocumentCatalog(os.path.join(workdir, "catalog.json")),
+        chunk_store_path=os.path.join(workdir, "chunks.json"),
+    )
+    embedder = QueryEmbeddingCache(embeddings, max_entries=0)
+    lexical = LexicalIndex(os.path.join(workdir, "chunks.json"))
+    rag.get_embeddings = lambda: embeddings
+    rag.get_vectorstore = lambda: store
+    rag.get_query_embedder = lambda: embedder
+    rag.get_lexical_index = lambda: lexical
+    return StubChatModel(llm_latency)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay ground-truth questions through rag_search.")
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="처리량 측정을 위해 전체 질문을 반복할 횟수")
+    parser.add_argument("--offline", action="store_true", help="가짜 임베딩/로컬 인덱스/스텁 LLM 사용")
+    parser.add_argument("--pdf", nargs="*", help="오프라인 적재 대상 (기본: backend/data/*.pdf)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="오프라인 스텁 LLM 지연(초)")
+    parser.add_argument("--warm-cache", action="store_true", help="답변 캐시를 켠 채로 측정")
+    parser.add_argument("--retrieval", choices=("vector", "hybrid", "both"), default=rag.RETRIEVAL_MODE)
+    parser.add_argument("--question-col")
+    parser.add_argument("--file-col")
+    parser.add_argument("--pages-col")
+    parser.add_argument("--clause-col")
+    parser.add_argument("--out", help="결과 JSON 경로 (없으면 표준 출력)")
+    args = parser.parse_args(argv)
+
+    cases = load_ground_truth(args.ground_truth, args.question_col, args.file_col, args.pages_col, args.clause_col)
+    llm = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.offline:
+            pdfs = args.pdf or sorted(
+                os.path.join(rag.DATA_DIR, f) for f in os.listdir(rag.DATA_DIR) if f.lower().endswith(".pdf")
+            )
+            llm = setup_offline(workdir, pdfs, args.llm_latency)
+            _resolve_file_names(cases, [os.path.basename(p) for p in pdfs])
+        else:
+            from .catalog import get_catalog
+            _resolve_file_names(cases, get_catalog().file_names())
+        if not args.warm_cache:
+            no_cache = AnswerCache(max_entries=0)
+            rag.get_answer_cache = lambda: no_cache
+        modes = ("vector", "hybrid") if args.retrieval == "both" else (args.retrieval,)
+        runs = {}
+        for mode in modes:
+            rag.RETRIEVAL_MODE = mode
+            if not args.warm_cache:
+                # 쿼리 벡터 캐시도 모드마다 새로 두고 끈다
+                # (--repeat 반복이나 앞선 모드가 채운 벡터로 임베딩 단계를 건너뛰면 지연 비교가 틀어진다)
+                embedder = QueryEmbeddingCache(rag.get_embeddings(), max_entries=0)
+                rag.get_query_embedder = lambda embedder=embedder: embedder
+            runs[mode] = asyncio.run(run_benchmark(cases, args.k, args.concurrency, args.repeat, llm=llm))
+
+    report = {"runs": runs}
+    report["config"] = {
+        "mode": "offline" if args.offline else rag.VECTOR_BACKEND,
+        "retrieval": list(modes),
+        "ground_truth": os.path.basename(args.ground_truth),
+        "k": args.k,
+        "concurrency": args.concurrency,
+        "repeat": args.repeat,
+        "warm_cache": args.warm_cache,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        summary = {
+            mode: {key: run[key] for key in ("quality", "prompt_tokens", "throughput")} for mode, run in runs.items()
+        }
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
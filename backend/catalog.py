@@ -0,0 +1,146 @@
+# backend/catalog.py
+"""적재된 문서 카탈로그: file_name -> {category, page_count, chunk_count, fingerprint}.
+
+ingest가 적재할 때마다 catalog.json을 갱신하고, 서버는 메모리에 올려 둔 카탈로그로
+/api/contracts에 응답한다 (요청마다 인덱스를 순회하지 않는다).
+백그라운드 스레드가 파일 변경(mtime)을 감지해 다시 읽고, fingerprint가 바뀐 파일을 알려 준다.
+
+NOTE: main.py 기동 경로에서 임포트되므로 무거운 RAG 모듈을 모듈 수준에서 임포트하지 않는다.
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+CATALOG_PATH = os.getenv("RAG_CATALOG_PATH") or os.path.join(
+    os.getenv("RAG_LOCAL_INDEX_DIR") or os.path.join(os.path.dirname(__file__), "data", "index"),
+    "catalog.json",
+)
+
+
+class DocumentCatalog:
+    def __init__(self, path: str = CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._mtime: float | None = None
+        # category별 (ETag, 응답 본문) — 카탈로그가 바뀔 때만 다시 만든다
+        self._responses: dict[str | None, tuple[str, bytes]] = {}
+        self.reload_if_changed()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entries(self) -> dict[str, dict]:
+        return dict(self._entries)
+
+    def _set(self, entries: dict[str, dict]) -> set[str]:
+        with self._lock:
+            old = self._entries
+            changed = {
+                name for name in set(old) | set(entries)
+                if (old.get(name) or {}).get("fingerprint") != (entries.get(name) or {}).get("fingerprint")
+            }
+            self._entries = entries
+            self._responses = {}
+            return changed
+
+    def reload_if_changed(self) -> set[str]:
+        """catalog.json이 바뀌었으면 다시 읽고, fingerprint가 달라진 file_name 집합을 반환한다."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return set()
+        if mtime == self._mtime:
+            return set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            entries = json.load(f).get("files", {})
+        self._mtime = mtime
+        return self._set(entries)
+
+    def replace(self, entries: dict[str, dict], save: bool = True) -> set[str]:
+        changed = self._set(dict(entries))
+        if save:
+            self.save()
+        return changed
+
+    def merge(self, entries: dict[str, dict]) -> set[str]:
+        """ingest용: 디스크의 최신 카탈로그에 entries를 덮어써 저장한다."""
+        self.reload_if_changed()
+        return self.replace({**self._entries, **entries})
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"files": self._entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+        self._mtime = os.stat(self.path).st_mtime
+
+    def file_names(self, category: str | None = None) -> list[str]:
+        names = [n for n, e in self._entries.items() if not category or e.get("category") == category]
+        return sorted(names, key=lambda x: x.lower())
+
+    def response(self, category: str | None = None) -> tuple[str, bytes]:
+        """/api/contracts 응답 (ETag, JSON 본문). 카탈로그가 바뀌기 전까지 재사용한다."""
+        cached = self._responses.get(category)
+        if cached is None:
+            body = json.dumps({"contracts": self.file_names(category)}, ensure_ascii=False).encode("utf-8")
+            cached = (f'"{hashlib.sha1(body).hexdigest()[:16]}"', body)
+            self._responses[category] = cached
+        return cached
+
+
+def summarize(metadatas) -> dict[str, dict]:
+    """청크 메타데이터들을 file_name별 카탈로그 항목으로 요약한다 (인덱스 스캔 결과용)."""
+    files: dict[str, dict] = {}
+    for md in metadatas:
+        name = (md or {}).get("file_name")
+        if not name:
+            continue
+        entry = files.setdefault(name, {"category": md.get("category"), "pages": set(), "chunk_count": 0})
+        entry["chunk_count"] += 1
+        if md.get("page_num") is not None:
+            entry["pages"].add(md["page_num"])
+    return {
+        name: {
+            "category": e["category"],
+            "page_count": len(e["pages"]),
+            "chunk_count": e["chunk_count"],
+            "fingerprint": f"scan:{len(e['pages'])}:{e['chunk_count']}",
+        }
+        for name, e in files.items()
+    }
+
+
+@lru_cache(maxsize=1)
+def get_catalog() -> DocumentCatalog:
+    return DocumentCatalog(CATALOG_PATH)
+
+
+def start_refresher(catalog: DocumentCatalog, interval: float, on_change=None, bootstrap=None) -> threading.Event:
+    """카탈로그를 주기적으로 다시 읽는 데몬 스레드를 시작한다. 반환된 Event를 set하면 멈춘다.
+
+    카탈로그 파일이 아직 없으면 bootstrap()의 결과(인덱스 스캔)로 한 번 채운다.
+    """
+    stop = threading.Event()
+
+    def _run():
+        if not len(catalog) and bootstrap is not None:
+            try:
+                entries = bootstrap()
+                # 스캔 결과가 비면(자격증명 없음, list_paginated 없는 pod 인덱스 등) 빈 catalog.json을 쓰지 않는다
+                if entries:
+                    catalog.replace(entries)
+            except Exception:
+                pass
+        while not stop.wait(interval):
+            try:
+                changed = catalog.reload_if_changed()
+            except Exception:
+                continue
+            if changed and on_change is not None:
+                on_change(changed)
+
+    threading.Thread(target=_run, name="catalog-refresh", daemon=True).start()
+    return stop
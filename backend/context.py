@@ -0,0 +1,164 @@
+# backend/context.py
+"""검색된 청크를 토큰 예산 안에서 프롬프트 컨텍스트로 묶는다.
+
+- count_tokens: tiktoken(o200k_base, gpt-4.1 계열)으로 센다. 없으면 글자 수 기반 추정
+- 거의 같은 청크(인접 페이지의 겹치는 청크, 중복 적재 등)는 순위가 낮은 쪽을 버린다
+- 같은 파일·같은 페이지의 청크는 겹치는 부분을 지우고 한 블록으로 합친다 (인용 p.X는 그대로)
+- 관련도 순(검색 순위)으로 예산이 찰 때까지 채운다
+
+pack_context가 돌려주는 Document 목록이 프롬프트에 실제로 들어간 내용이며,
+preview_chunks/sources도 이 목록으로 만들어 인용과 컨텍스트가 어긋나지 않게 한다.
+"""
+import math
+import os
+import re
+import threading
+import time
+
+from langchain_core.documents import Document
+
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None  # optional, fall back to heuristic
+
+_SHINGLE = re.compile(r"\w+")
+
+# 인코딩 파일을 받지 못했을 때 다시 시도하기까지의 간격(초)
+ENCODING_RETRY_SECONDS = float(os.getenv("RAG_TOKENIZER_RETRY", "300"))
+
+_encoding_lock = threading.Lock()
+_encoding_obj = None
+_encoding_failed_at: float | None = None
+_encoding_retrying = False
+
+
+def load_encoding():
+    """o200k_base 인코딩을 불러온다. 처음에는 인코딩 파일을 내려받으므로 (수 초) 이벤트 루프 밖에서 부른다.
+
+    서버는 lifespan에서 스레드로 미리 부른다. 내려받을 수 없는 환경은 TIKTOKEN_CACHE_DIR에 파일을 두면 된다.
+    실패하면 None을 돌려주고, 그동안 count_tokens는 글자 수 추정을 쓴다.
+    """
+    global _encoding_obj, _encoding_failed_at, _encoding_retrying
+    with _encoding_lock:
+        if _encoding_obj is None and tiktoken is not None:
+            try:
+                _encoding_obj = tiktoken.get_encoding("o200k_base")
+                _encoding_failed_at = None
+            except Exception:
+                # 인코딩 파일을 받을 수 없는 환경(오프라인) 등
+                _encoding_failed_at = time.monotonic()
+        _encoding_retrying = False
+        return _encoding_obj
+
+
+def _encoding():
+    global _encoding_retrying
+    if _encoding_obj is not None or tiktoken is None:
+        return _encoding_obj
+    if _encoding_failed_at is None:
+        # 미리 불러오지 않은 경우(CLI 등)는 처음 쓸 때 불러온다
+        return load_encoding()
+    if time.monotonic() - _encoding_failed_at >= ENCODING_RETRY_SECONDS and not _encoding_retrying:
+        # 실패를 영구히 기억하지 않되, 재시도는 백그라운드에서 해 호출한 쪽(이벤트 루프)을 막지 않는다
+        _encoding_retrying = True
+        threading.Thread(target=load_encoding, name="tokenizer-load", daemon=True).start()
+    return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # 추정치: 영문/숫자는 4글자당 1토큰, 한글 등 비 ASCII는 글자당 1토큰
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _SHINGLE.findall(text.lower())
+    if len(words) <= n:
+        return {tuple(words)}
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _near_duplicate(a: set, b: set, threshold: float) -> bool:
+    if not a or not b:
+        return False
+    # 한쪽이 다른 쪽에 거의 포함되는 경우(짧은 청크가 긴 청크의 일부)도 중복으로 본다
+    return len(a & b) / min(len(a), len(b)) >= threshold
+
+
+def _overlap(first: str, second: str, min_overlap: int = 20, max_overlap: int = 600) -> int:
+    for size in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """청크 오버랩으로 겹치는 부분은 한 번만 남기고 잇는다. 페이지 안의 앞뒤 순서를 따른다."""
+    size = _overlap(first, second)
+    if size:
+        return first + second[size:]
+    size = _overlap(second, first)
+    if size:
+        return second + first[size:]
+    return f"{first}\n…\n{second}"
+
+
+def pack_context(
+    docs: list[Document],
+    budget: int,
+    render,
+    dedup_threshold: float = 0.9,
+) -> tuple[list[Document], str, int]:
+    """docs(관련도 순)를 render(doc) -> str 줄로 만들어 budget 토큰 안에 채운다.
+
+    반환: (프롬프트에 들어간 Document 목록, 컨텍스트 문자열, 컨텍스트 토큰 수).
+    첫 블록이 혼자서 예산을 넘으면 잘라서라도 넣는다 (근거가 하나도 없는 답변 방지).
+    """
+    blocks: list[dict] = []
+    by_page: dict[tuple, dict] = {}
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(_near_duplicate(shingles, s, dedup_threshold) for block in blocks for s in block["shingles"]):
+            continue
+        page_key = (doc.metadata.get("file_name"), doc.metadata.get("page_num"))
+        block = by_page.get(page_key) if page_key[0] is not None else None
+        if block is None:
+            block = {"doc": doc, "text": doc.page_content, "shingles": [shingles]}
+            blocks.append(block)
+            if page_key[0] is not None:
+                by_page[page_key] = block
+        else:
+            block["text"] = _join_overlapping(block["text"], doc.page_content)
+            block["shingles"].append(shingles)
+
+    kept: list[Document] = []
+    lines: list[str] = []
+    used = 0
+    for block in blocks:
+        doc = block["doc"]
+        if block["text"] != doc.page_content:
+            doc = Document(id=doc.id, page_content=block["text"], metadata=dict(doc.metadata))
+        line = render(doc)
+        tokens = count_tokens(line) + 1  # 줄바꿈
+        if used + tokens > budget:
+            if kept:
+                continue  # 더 짧은 다음 블록은 들어갈 수 있다
+            line = _truncate(line, budget)
+            tokens = count_tokens(line)
+        kept.append(doc)
+        lines.append(line)
+        used += tokens
+    return kept, "\n".join(lines), used
+
+
+def _truncate(text: str, budget: int) -> str:
+    enc = _encoding()
+    if enc is not None:
+        return enc.decode(enc.encode(text, disallowed_special=())[:budget])
+    while text and count_tokens(text) > budget:
+        text = text[: int(len(text) * 0.9)]
+    return text
@@ -0,0 +1,152 @@
+# backend/embedding_cache.py
+"""쿼리 임베딩 캐시.
+
+한 요청 안의 모든 검색(계약서/법령)이 같은 쿼리 벡터를 재사용하고,
+반복 질문은 OpenAI 임베딩 호출 없이 메모리 LRU(선택적으로 디스크)에서 바로 꺼낸다.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+
+def normalize_query(text: str) -> str:
+    # 공백 차이만 있는 질문은 같은 벡터를 쓰도록 정규화한 문자열을 그대로 임베딩한다
+    return " ".join((text or "").split())
+
+
+class QueryEmbeddingCache:
+    """embed_query 결과를 (모델, 정규화 쿼리) 키로 캐시한다.
+
+    - 메모리: max_entries 크기의 LRU (0이면 메모리 캐시 비활성)
+    - 디스크: path가 주어지면 sqlite 파일에 float32로 저장해 재시작 후에도 유지
+    """
+
+    def __init__(self, embeddings, model: str = "", max_entries: int = 2048, path: str | None = None):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", "") or ""
+        self.max_entries = max_entries
+        self._lru: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # sqlite 연결 전용 락: 디스크 I/O가 LRU 락을 잡지 않아 이벤트 루프가 기다리지 않는다
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+            self._db.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key: str) -> list[float] | None:
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+            return vec
+
+    def _disk_get(self, keys: list[str]) -> dict[str, list[float]]:
+        if self._db is None or not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, vec FROM query_embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+        found = {key: array("f", blob).tolist() for key, blob in rows}
+        with self._lock:
+            for key, vec in found.items():
+                self._remember(key, vec)
+            self.disk_hits += len(found)
+            return found
+
+    def _remember(self, key: str, vec: list[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _miss(self, items: list[tuple[str, list[float]]]) -> None:
+        # 메모리에는 바로 넣고, 디스크 쓰기는 _disk_put이 한 트랜잭션으로 한다
+        with self._lock:
+            self.misses += len(items)
+            for key, vec in items:
+                self._remember(key, vec)
+
+    def _disk_put(self, items: list[tuple[str, list[float]]]) -> None:
+        if self._db is None or not items:
+            return
+        rows = [(key, array("f", vec).tobytes()) for key, vec in items]
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (key, vec) VALUES (?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def embed(self, text: str) -> list[float]:
+        text = normalize_query(text)
+        key = self._key(text)
+        vec = self._memory_get(key)
+        if vec is None:
+            vec = self._disk_get([key]).get(key)
+        if vec is None:
+            vec = self.embeddings.embed_query(text)
+            self._miss([(key, vec)])
+            self._disk_put([(key, vec)])
+        return vec
+
+    # 비동기 경로: sqlite 조회/쓰기는 이벤트 루프를 막지 않도록 스레드에서 실행한다
+    async def aembed(self, text: str) -> list[float]:
+        text = normalize_query(text)
+        key = self._key(text)
+        vec = self._memory_get(key)
+        if vec is None and self._db is not None:
+            vec = (await asyncio.to_thread(self._disk_get, [key])).get(key)
+        if vec is None:
+            vec = await self.embeddings.aembed_query(text)
+            self._miss([(key, vec)])
+            if self._db is not None:
+                await asyncio.to_thread(self._disk_put, [(key, vec)])
+        return vec
+
+    async def aembed_many(self, texts: list[str]) -> list[list[float]]:
+        """여러 쿼리를 한 번에 임베딩한다. 캐시에 없는 것만 모아 embed_documents 한 번으로 보낸다."""
+        normalized = [normalize_query(t) for t in texts]
+        keys = {text: self._key(text) for text in dict.fromkeys(normalized)}
+        vectors: dict[str, list[float]] = {}
+        for text, key in keys.items():
+            vec = self._memory_get(key)
+            if vec is not None:
+                vectors[text] = vec
+        if self._db is not None and len(vectors) < len(keys):
+            found = await asyncio.to_thread(self._disk_get, [k for t, k in keys.items() if t not in vectors])
+            vectors.update({text: found[key] for text, key in keys.items() if key in found})
+        missing = [text for text in keys if text not in vectors]
+        if missing:
+            embedded = [list(vec) for vec in await self.embeddings.aembed_documents(missing)]
+            items = [(keys[text], vec) for text, vec in zip(missing, embedded)]
+            self._miss(items)
+            if self._db is not None:
+                await asyncio.to_thread(self._disk_put, items)
+            vectors.update(zip(missing, embedded))
+        return [vectors[text] for text in normalized]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._lru),
+            }
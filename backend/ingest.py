@@ -0,0 +1,290 @@
+# backend/ingest.py
+"""backend/data의 PDF를 청크로 나눠 임베딩하고 설정된 벡터 저장소에 적재한다.
+
+실행: python -m backend.ingest [PDF ...] [--category contract] [--workers 4]
+
+1) 페이지 단위 텍스트 추출 (프로세스 풀)
+2) 조항(Article/Section/1.2/제n조) 경계 기준 청크 + 앞 청크 꼬리 겹침
+3) 배치 임베딩 (동시 실행 수 제한 + 지수 백오프 재시도)
+4) 벡터 저장소에 일괄 upsert
+
+페이지 본문 해시를 상태 파일에 기록해 두고, 바뀐 페이지만 다시 임베딩한다.
+청크 id는 (파일명, 페이지, 본문)의 해시이므로 같은 내용이면 같은 id가 된다.
+청크 본문은 어휘(BM25) 검색용 청크 저장소(RAG_CHUNK_STORE)에도 기록한다.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import rag
+from .catalog import DocumentCatalog, get_catalog
+from .local_index import LocalVectorIndex
+
+DATA_DIR = rag.DATA_DIR
+STATE_PATH = os.getenv("RAG_INGEST_STATE") or os.path.join(rag.LOCAL_INDEX_DIR, "ingest_state.json")
+
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+PAGES_PER_TASK = 8
+
+# 조항 시작 줄: "ARTICLE 12", "Section 5", "12.3 ...", "제12조"
+CLAUSE_START = re.compile(
+    r"^\s*(?:(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause)\s+[0-9IVXLC]+|\d+(?:\.\d+)+\.?\s|제\s*\d+\s*조)",
+    re.MULTILINE,
+)
+
+
+# --- 1) 추출 ----------------------------------------------------------------
+def _extract_range(path: str, start: int, end: int) -> list[tuple[int, str]]:
+    # 프로세스 풀 워커: 각 워커가 PDF를 열어 자기 페이지 구간만 읽는다
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def extract_pages(paths: list[str], workers: int) -> dict[str, list[tuple[int, str]]]:
+    from pypdf import PdfReader
+
+    tasks = []
+    for path in paths:
+        n_pages = len(PdfReader(path).pages)
+        for start in range(0, n_pages, PAGES_PER_TASK):
+            tasks.append((path, start, min(start + PAGES_PER_TASK, n_pages)))
+    pages: dict[str, list[tuple[int, str]]] = {path: [] for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(path, pool.submit(_extract_range, path, start, end)) for path, start, end in tasks]
+        for path, future in futures:
+            pages[path].extend(future.result())
+    return pages
+
+
+# --- 2) 청크 ----------------------------------------------------------------
+def split_clauses(text: str) -> list[str]:
+    starts = [m.start() for m in CLAUSE_START.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [c for c in (text[a:b].strip() for a, b in zip(starts, starts[1:] + [len(text)])) if c]
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """조항 단위로 묶되 max_chars를 넘지 않게 자르고, 각 청크 앞에 이전 청크 꼬리를 붙인다."""
+    pieces: list[str] = []
+    for clause in split_clauses(text):
+        # 한 조항이 너무 길면 겹치는 창으로 자른다
+        step = max_chars - overlap
+        pieces.extend(clause[i:i + max_chars] for i in range(0, max(len(clause) - overlap, 1), step))
+
+    chunks: list[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            # 겹침 꼬리는 새 청크가 max_chars를 넘지 않는 만큼만 붙이고,
+            # 단어 중간에서 시작하지 않도록 첫 공백 뒤부터 쓴다
+            room = min(overlap, max_chars - len(piece) - 1)
+            tail = current[-room:] if room > 0 else ""
+            tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+            current = f"{tail}\n{piece}" if tail else piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha1("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+# --- 3) 임베딩 --------------------------------------------------------------
+def _embed_with_retry(embeddings, texts: list[str], attempts: int = 5) -> list[list[float]]:
+    for attempt in range(attempts):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(min(30.0, 2 ** attempt) + random.random())
+
+
+def embed_batches(embeddings, texts: list[str], batch_size: int, concurrency: int) -> list[list[float]]:
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(lambda batch: _embed_with_retry(embeddings, batch), batches)
+        return [vec for batch in results for vec in batch]
+
+
+# --- 4) 적재 ----------------------------------------------------------------
+def upsert_chunks(store, ids: list[str], vectors, texts: list[str], metadatas: list[dict], batch_size: int = 100) -> None:
+    if isinstance(store, LocalVectorIndex):
+        store.upsert(ids, vectors, texts, metadatas)
+        return
+    # PineconeVectorStore: 미리 계산한 벡터를 본문(text 키)과 함께 직접 upsert
+    for i in range(0, len(ids), batch_size):
+        store.index.upsert(
+            vectors=[
+                {"id": ids[j], "values": list(vectors[j]), "metadata": {**metadatas[j], "text": texts[j]}}
+                for j in range(i, min(i + batch_size, len(ids)))
+            ],
+            namespace=rag.PINECONE_NAMESPACE,
+        )
+
+
+def load_state(path: str = STATE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: str = STATE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def load_chunk_store(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_chunk_store(chunks: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def catalog_entry(file_state: dict) -> dict:
+    pages = file_state["pages"]
+    return {
+        "category": file_state["category"],
+        "page_count": len(pages),
+        "chunk_count": sum(len(p["chunk_ids"]) for p in pages.values()),
+        "fingerprint": _hash(*(pages[k]["hash"] for k in sorted(pages, key=int))),
+    }
+
+
+def ingest(paths: list[str], category: str = "contract", workers: int = 4, batch_size: int = 64,
+           concurrency: int = 4, rebuild: bool = False, store=None, embeddings=None, state_path: str = STATE_PATH,
+           catalog: DocumentCatalog | None = None, chunk_store_path: str | None = None) -> dict:
+    store = rag.get_vectorstore() if store is None else store
+    embeddings = rag.get_embeddings() if embeddings is None else embeddings
+    catalog = get_catalog() if catalog is None else catalog
+    chunk_store_path = chunk_store_path or rag.CHUNK_STORE_PATH
+    chunk_store = load_chunk_store(chunk_store_path)
+    # rebuild여도 이전 상태는 읽어 둔다: 이전 청크를 지우는 데 필요하다
+    state = load_state(state_path)
+
+    t0 = time.perf_counter()
+    pages_by_path = extract_pages(paths, workers)
+    t_extract = time.perf_counter() - t0
+
+    new_ids, new_texts, new_metas, stale_ids = [], [], [], []
+    changed_files: set[str] = set()
+    pages_total = pages_changed = 0
+    for path, pages in pages_by_path.items():
+        file_name = os.path.basename(path)
+        previous = state["files"].get(file_name, {}).get("pages", {})
+        current: dict[str, dict] = {}
+        for page_num, text in sorted(pages):
+            pages_total += 1
+            page_hash = _hash(text)
+            metadata = {"file_name": file_name, "category": category, "page_num": page_num}
+            chunks: dict[str, str] = {}
+            for chunk in chunk_text(text):
+                chunks.setdefault(_hash(file_name, str(page_num), chunk), chunk)
+            # 청크 저장소(어휘 검색용)는 바뀌지 않은 페이지도 채워 둔다 (id가 같으므로 덮어써도 무방)
+            for chunk_id, chunk in chunks.items():
+                chunk_store[chunk_id] = {"text": chunk, **metadata}
+            current[str(page_num)] = {"hash": page_hash, "chunk_ids": list(chunks)}
+            old = previous.get(str(page_num))
+            if old and old["hash"] == page_hash and old["chunk_ids"] == list(chunks) and not rebuild:
+                continue
+            pages_changed += 1
+            changed_files.add(file_name)
+            if old:
+                stale_ids.extend(old["chunk_ids"])
+            for chunk_id, chunk in chunks.items():
+                new_ids.append(chunk_id)
+                new_texts.append(chunk)
+                new_metas.append(dict(metadata))
+        # 문서에서 사라진 페이지의 청크 제거
+        for page_num, old in previous.items():
+            if page_num not in current:
+                stale_ids.extend(old["chunk_ids"])
+                changed_files.add(file_name)
+        state["files"][file_name] = {"category": category, "pages": current}
+
+    t1 = time.perf_counter()
+    vectors = embed_batches(embeddings, new_texts, batch_size, concurrency) if new_texts else []
+    t_embed = time.perf_counter() - t1
+
+    t2 = time.perf_counter()
+    # 내용이 같은 청크는 id가 같으므로 새로 넣을 id는 지우지 않는다
+    stale_ids = sorted(set(stale_ids) - set(new_ids))
+    if stale_ids:
+        store.delete(ids=stale_ids)
+    if new_ids:
+        upsert_chunks(store, new_ids, vectors, new_texts, new_metas)
+    if isinstance(store, LocalVectorIndex):
+        store.save()
+    for chunk_id in stale_ids:
+        chunk_store.pop(chunk_id, None)
+    save_chunk_store(chunk_store, chunk_store_path)
+    save_state(state, state_path)
+    # /api/contracts가 읽는 카탈로그 갱신 (서버는 파일 변경을 감지해 다시 읽는다)
+    catalog.merge(
+        {os.path.basename(path): catalog_entry(state["files"][os.path.basename(path)]) for path in pages_by_path}
+    )
+    t_upsert = time.perf_counter() - t2
+
+    # 같은 프로세스에서 서비스 중이면 바뀐 계약서의 캐시된 답변을 무효화
+    for file_name in changed_files:
+        rag.get_answer_cache().invalidate_file(file_name)
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "files": len(pages_by_path),
+        "pages": pages_total,
+        "pages_changed": pages_changed,
+        "chunks_embedded": len(new_ids),
+        "chunks_deleted": len(stale_ids),
+        "extract_s": round(t_extract, 3),
+        "embed_s": round(t_embed, 3),
+        "upsert_s": round(t_upsert, 3),
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_s": round(pages_total / t_extract, 2) if t_extract else 0.0,
+        "chunks_per_s": round(len(new_ids) / (t_embed + t_upsert), 2) if new_ids else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the configured vector store.")
+    parser.add_argument("paths", nargs="*", help="PDF 경로 (기본: backend/data/*.pdf)")
+    parser.add_argument("--category", default="contract")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="텍스트 추출 프로세스 수")
+    parser.add_argument("--batch-size", type=int, default=64, help="임베딩 호출당 청크 수")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시 임베딩 호출 수")
+    parser.add_argument("--rebuild", action="store_true", help="바뀌지 않은 페이지도 전부 다시 임베딩")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(
+        os.path.join(DATA_DIR, f) for f in os.listdir(DATA_DIR) if f.lower().endswith(".pdf")
+    )
+    report = ingest(paths, category=args.category, workers=args.workers, batch_size=args.batch_size,
+                    concurrency=args.concurrency, rebuild=args.rebuild)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
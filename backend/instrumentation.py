@@ -0,0 +1,223 @@
+# backend/instrumentation.py
+"""rag_search 단계별 소요 시간 기록과 Prometheus 지표.
+
+    with record_stages() as stages:
+        rag_search(...)
+    stages  # {"embed": 0.12, "vector_query": 0.03, "prompt_build": 0.001, "llm": 2.4}
+
+record_stages() 밖에서도 stage()는 단계별 지연 히스토그램과 오류 카운터를 갱신한다.
+contextvar를 쓰므로 동시 요청(스레드/태스크)끼리 섞이지 않는다.
+
+지표는 외부 라이브러리 없이 메모리에 모아 두고 render_metrics()가 Prometheus 텍스트 형식으로 내보낸다.
+관측 한 번은 락 하나와 버킷 탐색(bisect)뿐이라 운영에서 켜 두어도 된다.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_stages: ContextVar[dict | None] = ContextVar("rag_stages", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 10, 15, 20, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, values)} {_number(total)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # 라벨 값별 [버킷별 개수(누적 아님)..., +Inf], 합계, 개수
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total, n) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    le_label = f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le_label)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_number(round(total, 6))}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, values)} {n}")
+        return lines
+
+
+REGISTRY: list = []
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Time spent in each RAG stage.", ("stage",))
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Exceptions raised inside each RAG stage.", ("stage",))
+REQUEST_SECONDS = Histogram("rag_http_request_duration_seconds", "HTTP request latency.", ("path",))
+REQUESTS = Counter("rag_http_requests_total", "HTTP requests by path and status.", ("path", "status"))
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens reported by the provider.", ("kind",))
+CHUNKS = Histogram(
+    "rag_chunks_per_request", "Chunks retrieved and placed in the prompt per request.", ("kind",), COUNT_BUCKETS
+)
+
+
+@contextmanager
+def record_stages():
+    stages: dict[str, float] = {}
+    token = _stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _stages.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # 취소/클라이언트 연결 종료(CancelledError, GeneratorExit)는 오류로 세지 않는다
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, name)
+        stages = _stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+
+def record_chunks(retrieved: int, in_prompt: int) -> None:
+    CHUNKS.observe(retrieved, "retrieved")
+    CHUNKS.observe(in_prompt, "prompt")
+
+
+def record_usage(message) -> dict:
+    """LLM 응답의 usage_metadata를 카운터에 더하고 {"prompt_tokens", "completion_tokens"}로 돌려준다."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        return {}
+    prompt_tokens = int(usage.get("input_tokens") or 0)
+    completion_tokens = int(usage.get("output_tokens") or 0)
+    cached = int((usage.get("input_token_details") or {}).get("cache_read") or 0)
+    LLM_TOKENS.inc("prompt", amount=prompt_tokens)
+    LLM_TOKENS.inc("completion", amount=completion_tokens)
+    if cached:
+        LLM_TOKENS.inc("cached_prompt", amount=cached)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+
+
+def _render_snapshot(kind: str, name: str, help_text: str, label_name: str, values: dict) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_value, value in values.items():
+        lines.append(f"{name}{_labels((label_name,), (label_value,))} {_number(value)}")
+    return lines
+
+
+def render_gauge(name: str, help_text: str, label_name: str, values: dict) -> list[str]:
+    """수집 시점에 읽은 현재 값(항목 수 등)을 게이지로 내보낸다."""
+    return _render_snapshot("gauge", name, help_text, label_name, values)
+
+
+def render_counter(name: str, help_text: str, label_name: str, values: dict) -> list[str]:
+    """다른 객체가 누적 중인 단조 증가 값(캐시 적중 수 등)을 수집 시점에 읽어 카운터로 내보낸다."""
+    return _render_snapshot("counter", name, help_text, label_name, values)
+
+
+def render_metrics(extra_lines: list[str] = ()) -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(stages: dict, total: float | None = None) -> str:
+    """Server-Timing 헤더 값 (밀리초). 예: embed;dur=120.3, llm;dur=2400.1, total;dur=2530.0"""
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class InstrumentationMiddleware:
+    """ASGI 미들웨어: 요청마다 record_stages()로 단계 시간을 모아 Server-Timing 헤더를 붙이고,
+    경로/상태별 요청 수와 지연을 기록한다.
+
+    헤더는 응답 시작 시점까지 끝난 단계만 담는다 (스트리밍 응답은 본문 전송 전 단계까지).
+    """
+
+    def __init__(self, app, paths_prefix: str = "/api/"):
+        self.app = app
+        self.paths_prefix = paths_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope.get("path", "")
+        # 라벨 개수를 제한하기 위해 API 경로만 그대로 쓰고 나머지는 하나로 묶는다
+        label = path if path.startswith(self.paths_prefix) else "other"
+        status = {"code": 500}
+        t0 = time.perf_counter()
+
+        with record_stages() as stages:
+            async def _send(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    timing = server_timing(stages, time.perf_counter() - t0).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing)]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                if status["code"] == 404:
+                    label = "other"
+                REQUEST_SECONDS.observe(time.perf_counter() - t0, label)
+                REQUESTS.inc(label, str(status["code"]))
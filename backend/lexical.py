@@ -0,0 +1,177 @@
+# backend/lexical.py
+"""계약서별 BM25 역색인과 벡터 결과 융합(RRF), 조항 번호 직접 조회.
+
+"Article 12.3", "Take or Pay", "AFE" 처럼 정확한 용어가 들어간 질문은 밀집 검색이 놓치기 쉽다.
+- tokenize: 영문/숫자(12.3 같은 조항 번호 포함)는 단어 단위, 한글은 2-gram
+- BM25Index: 한 계약서의 청크에 대한 BM25
+- reciprocal_rank_fusion: 벡터/어휘 순위를 RRF로 합친다
+- parse_clause_reference: 질문이 조항 번호만 가리키면 임베딩 없이 어휘 색인에서 바로 찾는다
+
+청크 본문은 ingest가 쓰는 청크 저장소(chunks.json)에서 읽는다.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from langchain_core.documents import Document
+
+_WORD = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+|[가-힣]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to was what which with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for tok in _WORD.findall((text or "").lower()):
+        if "가" <= tok[0] <= "힣":
+            tokens.extend([tok] if len(tok) == 1 else [tok[i:i + 2] for i in range(len(tok) - 1)])
+        elif tok not in STOPWORDS:
+            tokens.append(tok)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, docs: list[Document], k1: float = 1.2, b: float = 0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._lengths = []
+        for i, doc in enumerate(docs):
+            counts = Counter(tokenize(doc.page_content))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings.setdefault(term, []).append((i, tf))
+        self._avgdl = (sum(self._lengths) / len(docs)) if docs else 0.0
+        n = len(docs)
+        self._idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()
+        }
+
+    def search(self, query: str, k: int = 5) -> list[tuple[Document, float]]:
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._avgdl)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(self.docs[i], score) for i, score in top]
+
+
+# --- 조항 번호 직접 조회 ------------------------------------------------------
+_CLAUSE_REF = re.compile(
+    r"^\s*(?:(?:article|art\.?|section|sec\.?|clause|조항|조문)\s*)?(?:제\s*)?(\d+(?:\.\d+)*)\s*(?:조|항)?\s*$",
+    re.IGNORECASE,
+)
+# 조항 번호 앞뒤에 붙는 요청 표현은 무시한다 ("Article 12.3 보여줘", "show section 5")
+_FILLER = re.compile(
+    r"\b(?:show|me|the|what|does|say|says|text|of|find|full|please|read)\b|보여\s*줘|알려\s*줘|내용|전문|원문|은|는|의|[?!:]|\.(?!\d)",
+    re.IGNORECASE,
+)
+
+
+def parse_clause_reference(query: str) -> str | None:
+    """질문이 순수한 조항/섹션 번호 참조면 번호("12.3")를, 아니면 None을 반환한다."""
+    m = _CLAUSE_REF.match(_FILLER.sub(" ", query or ""))
+    return m.group(1) if m else None
+
+
+def clause_pattern(ref: str) -> re.Pattern:
+    # 다른 번호의 일부(112.3, 12.31)는 제외. "제12조" 표기도 허용
+    escaped = re.escape(ref)
+    return re.compile(rf"(?<![\d.]){escaped}(?![\d])(?!\.\d)|제\s*{escaped}\s*조", re.IGNORECASE)
+
+
+_HEADING_KEYWORDS = ("article", "section", "clause", "art", "sec")
+# 줄 머리의 맨 번호 뒤에 오는 제목 표시: 줄 끝, "5." "5)" "5:", 대문자/한글로 시작하는 제목
+_HEADING_TAIL = re.compile(r"\s*$|[.):]|\s+[A-Z가-힣(]", re.MULTILINE)
+
+
+def _is_heading(text: str, m: re.Match) -> bool:
+    """조항 번호 매치가 조항 제목("ARTICLE 5", "5. Payment", "제5조")인지 본문 속 숫자인지."""
+    line_start = text.rfind("\n", 0, m.start()) + 1
+    prefix = text[line_start:m.start()].strip().lower().rstrip(".")
+    if prefix in _HEADING_KEYWORDS:
+        return True
+    if prefix:
+        return False
+    return m.group().startswith("제") or bool(_HEADING_TAIL.match(text, m.end()))
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int = 60, top_k: int = 5) -> list[Document]:
+    scores: dict = {}
+    first: dict = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.id or (doc.metadata.get("file_name"), doc.metadata.get("page_num"), doc.page_content[:64])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            first.setdefault(key, doc)
+    return [first[key] for key in sorted(scores, key=lambda key: -scores[key])[:top_k]]
+
+
+class LexicalIndex:
+    """청크 저장소를 file_name별 BM25Index로 색인한다. 저장소 파일이 바뀌면 다시 읽는다."""
+
+    def __init__(self, chunk_store_path: str):
+        self.path = chunk_store_path
+        self._lock = threading.Lock()
+        self._mtime: float | None = None
+        self._docs_by_file: dict[str, list[Document]] = {}
+        self._indexes: dict[str, BM25Index] = {}
+
+    def _refresh(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        by_file: dict[str, list[Document]] = {}
+        for chunk_id, chunk in chunks.items():
+            metadata = {k: v for k, v in chunk.items() if k != "text"}
+            by_file.setdefault(chunk.get("file_name"), []).append(
+                Document(id=chunk_id, page_content=chunk["text"], metadata=metadata)
+            )
+        for docs in by_file.values():
+            docs.sort(key=lambda d: (d.metadata.get("page_num") or 0, d.id))
+        self._docs_by_file, self._indexes, self._mtime = by_file, {}, mtime
+
+    def index_for(self, file_name: str) -> BM25Index | None:
+        with self._lock:
+            self._refresh()
+            index = self._indexes.get(file_name)
+            if index is None and file_name in self._docs_by_file:
+                index = self._indexes[file_name] = BM25Index(self._docs_by_file[file_name])
+            return index
+
+    def search(self, query: str, file_name: str, k: int = 5) -> list[Document]:
+        index = self.index_for(file_name)
+        return [doc for doc, _ in index.search(query, k)] if index else []
+
+    def find_clause(self, ref: str, file_name: str, k: int = 5) -> list[Document]:
+        """조항 번호가 등장하는 청크. 줄 머리(조항 제목)에 나오는 청크를 먼저, 그다음 등장 위치 순."""
+        index = self.index_for(file_name)
+        if index is None:
+            return []
+        pattern = clause_pattern(ref)
+        hits = []
+        for order, doc in enumerate(index.docs):
+            m = pattern.search(doc.page_content)
+            if not m:
+                continue
+            hits.append((0 if _is_heading(doc.page_content, m) else 1, order, doc))
+        # 조항 제목이 하나도 없으면 번호가 본문에 우연히 나온 것뿐이다 ("within 5 days", "5% per annum").
+        # 빈 결과를 돌려 일반 (하이브리드) 검색으로 넘긴다
+        if not any(rank == 0 for rank, _, _ in hits):
+            return []
+        hits.sort(key=lambda h: (h[0], h[1]))
+        return [doc for _, _, doc in hits[:k]]
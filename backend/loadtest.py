@@ -0,0 +1,164 @@
+# backend/loadtest.py
+"""스텁 임베딩/벡터/LLM 백엔드로 동기 rag_search와 비동기 arag_search의 처리량을 비교한다.
+
+실행: python -m backend.loadtest --requests 400 --concurrency 200
+
+- sync : 스레드풀(기본 40 워커, starlette/anyio 기본값과 동일)에서 rag_search 실행
+- async: 단일 이벤트 루프에서 arag_search를 동시에 실행 (LLM 동시 호출은 RAG_LLM_MAX_CONCURRENCY로 제한)
+네트워크/자격증명 없이 동작하며, 각 단계 지연은 인자로 조절한다.
+측정 전에 경로마다 시간을 재지 않는 요청을 하나 보내 일회성 비용(토크나이저 로딩, 첫 호출)을 빼고 비교한다.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+
+from . import rag
+from .answer_cache import AnswerCache
+from .embedding_cache import QueryEmbeddingCache
+
+
+class StubEmbeddings:
+    def __init__(self, latency: float, dim: int = 8):
+        self.latency = latency
+        self.dim = dim
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return [0.0] * self.dim
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return [0.0] * self.dim
+
+
+class StubVectorStore:
+    """벡터 조회 지연만 흉내 낸다 (임베딩은 StubEmbeddings가 담당)."""
+
+    def __init__(self, latency: float, k: int = 5):
+        self.latency = latency
+        self.k = k
+
+    def _docs(self, filter):
+        filter = filter or {}
+        file_name = filter.get("file_name", "contract_stub.pdf")
+        category = filter.get("category", "contract")
+        return [
+            Document(
+                page_content=f"Stub clause {i} for {file_name}.",
+                metadata={"file_name": file_name, "category": category, "page_num": i + 1},
+            )
+            for i in range(self.k)
+        ]
+
+    def similarity_search_by_vector(self, embedding, k=5, filter=None):
+        time.sleep(self.latency)
+        return self._docs(filter)[:k]
+
+    async def asimilarity_search_by_vector(self, embedding, k=5, filter=None):
+        await asyncio.sleep(self.latency)
+        return self._docs(filter)[:k]
+
+
+class StubChatModel:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, prompt_txt):
+        time.sleep(self.latency)
+        return AIMessage(content="【답변 요약】\n\nstub")
+
+    async def ainvoke(self, prompt_txt):
+        await asyncio.sleep(self.latency)
+        return AIMessage(content="【답변 요약】\n\nstub")
+
+
+def _summary(name: str, latencies: list[float], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "mode": name,
+        "requests": len(ordered),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1),
+    }
+
+
+def _query(i: int) -> str:
+    # 절반은 법령 키워드를 포함해 계약서/법령 두 번의 검색이 일어나게 한다
+    return f"Force Majeure 조항과 관련 법령 {i}" if i % 2 else f"Force Majeure notice period {i}"
+
+
+WARMUP_QUERY = "Force Majeure 조항과 관련 법령 warm-up"
+
+
+def run_sync(n: int, workers: int, llm) -> dict:
+    def one(i):
+        t0 = time.perf_counter()
+        rag.rag_search(_query(i), file_name="contract_stub.pdf", llm=llm)
+        return time.perf_counter() - t0
+
+    rag.rag_search(WARMUP_QUERY, file_name="contract_stub.pdf", llm=llm)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, range(n)))
+    return _summary(f"sync (threadpool={workers})", latencies, time.perf_counter() - t0)
+
+
+async def run_async(n: int, concurrency: int, llm) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            t0 = time.perf_counter()
+            await rag.arag_search(_query(i), file_name="contract_stub.pdf", llm=llm)
+            return time.perf_counter() - t0
+
+    # 같은 이벤트 루프에서 워밍업해야 루프별 LLM 세마포어 생성 등도 측정에서 빠진다
+    await rag.arag_search(WARMUP_QUERY, file_name="contract_stub.pdf", llm=llm)
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n)))
+    return _summary(f"async (clients={concurrency}, llm_cap={rag.LLM_MAX_CONCURRENCY})", latencies, time.perf_counter() - t0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200, help="동시 클라이언트 수")
+    parser.add_argument("--threadpool", type=int, default=40, help="동기 경로 워커 수")
+    parser.add_argument("--embed-latency", type=float, default=0.15)
+    parser.add_argument("--query-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    store = StubVectorStore(args.query_latency)
+    llm = StubChatModel(args.llm_latency)
+    rag.get_vectorstore = lambda: store
+
+    def fresh_caches():
+        # 두 경로가 같은 질문을 보내므로 실행마다 빈 캐시로 시작한다
+        # (앞선 실행이 채운 쿼리 벡터/답변이 다음 실행의 측정을 덮지 않도록). 답변 캐시는 끈다
+        embedder = QueryEmbeddingCache(StubEmbeddings(args.embed_latency), model="stub")
+        answer_cache = AnswerCache(max_entries=0)
+        rag.get_query_embedder = lambda: embedder
+        rag.get_answer_cache = lambda: answer_cache
+
+    fresh_caches()
+    results = [run_sync(args.requests, args.threadpool, llm)]
+    fresh_caches()
+    results.append(asyncio.run(run_async(args.requests, args.concurrency, llm)))
+    for r in results:
+        print(
+            f"{r['mode']:<40} {r['requests']:>5} req  {r['elapsed_s']:>7.2f}s  "
+            f"{r['throughput_rps']:>8.2f} req/s  p50 {r['p50_ms']:>8.1f}ms  p95 {r['p95_ms']:>8.1f}ms"
+        )
+    print(f"speedup: {results[1]['throughput_rps'] / results[0]['throughput_rps']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# backend/local_index.py
+"""Pinecone 대신 쓸 수 있는 프로세스 내 벡터 인덱스.
+
+계약서당 수천 청크 규모를 전제로 한다.
+- 벡터: L2 정규화된 행렬 (vectors.npy). float32는 읽기 시 memory-map으로 연다.
+  float16은 파일 크기만 절반으로 줄이는 저장 형식이며, 불러올 때 float32로 올려 계산한다
+  (float16 행렬곱은 BLAS를 타지 않아 필터 검색 한 번에 수십 ms가 걸린다)
+- 문서: docs.json (id, 본문, 메타데이터)
+- 필터: rag_search가 쓰는 file_name / category 는 값별 행 번호 배열을 미리 만들어 두고,
+  필터 검색은 해당 행만 점수를 계산한다 (내적 = 코사인 유사도)
+- 다른 프로세스(ingest)가 save()로 파일을 바꾸면 읽기 시 docs.json mtime을 보고 다시 불러온다
+"""
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Iterable
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+DOCS_FILE = "docs.json"
+_EMPTY_ROWS = np.zeros(0, dtype=np.int64)
+
+
+class LocalVectorIndex(VectorStore):
+    INDEXED_FIELDS = ("file_name", "category")
+    # 이벤트 루프에서 바로 점수를 계산할 최대 행렬 원소 수 (행 수 x 차원, 약 1-2 ms)
+    INLINE_SCORE_MAX = 1 << 22
+
+    def __init__(self, path: str, embedding=None, dtype: str = "float32"):
+        self.path = path
+        self._embedding = embedding
+        # 디스크 저장 형식. 메모리의 행렬(_matrix)은 항상 float32
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._row_of: dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._postings: dict[str, dict[Any, np.ndarray]] = {}
+        self._mtime: float | None = None
+        # 저장하지 않은 upsert/delete가 있으면 디스크 변경으로 덮어쓰지 않는다
+        self._dirty = False
+        if os.path.exists(os.path.join(path, DOCS_FILE)):
+            self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # --- 저장/불러오기 ---------------------------------------------------
+    def _load(self) -> bool:
+        docs_path = os.path.join(self.path, DOCS_FILE)
+        mtime = os.stat(docs_path).st_mtime
+        with open(docs_path, "r", encoding="utf-8") as f:
+            docs = json.load(f)
+        matrix = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")
+        if matrix.shape[0] != len(docs["ids"]):
+            # 다른 프로세스가 저장하는 중 (vectors.npy만 교체됨): 다음 읽기에서 다시 시도한다
+            return False
+        self._ids = docs["ids"]
+        self._texts = docs["texts"]
+        self._metadatas = docs["metadatas"]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self.dtype = matrix.dtype
+        self._matrix = matrix if matrix.dtype == np.float32 else matrix.astype(np.float32)
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._rebuild_postings()
+        self._mtime = mtime
+        self._dirty = False
+        return True
+
+    def _changed_on_disk(self) -> bool:
+        # stat 한 번뿐이라 이벤트 루프에서 불러도 된다
+        try:
+            mtime = os.stat(os.path.join(self.path, DOCS_FILE)).st_mtime
+        except FileNotFoundError:
+            return False
+        return mtime != self._mtime and not self._dirty
+
+    def reload_if_changed(self) -> bool:
+        """docs.json이 바뀌었으면(다른 프로세스의 save) 다시 불러온다. LexicalIndex와 같은 mtime 방식."""
+        if not self._changed_on_disk():
+            return False
+        with self._lock:
+            if not self._changed_on_disk():
+                return False
+            return self._load()
+
+    def save(self) -> None:
+        """살아 있는 행만 남겨 디스크에 쓰고 memory-map으로 다시 연다."""
+        with self._lock:
+            # (category, file_name) 순으로 정렬해 저장: 카테고리/계약서별 행이 연속 구간이 되어
+            # 필터 검색이 복사 없이 슬라이스로 끝난다
+            keep = sorted(
+                np.flatnonzero(self._alive),
+                key=lambda r: (str(self._metadatas[r].get("category", "")), str(self._metadatas[r].get("file_name", ""))),
+            )
+            keep = np.asarray(keep, dtype=np.int64)
+            os.makedirs(self.path, exist_ok=True)
+            vectors_path = os.path.join(self.path, VECTORS_FILE)
+            docs_path = os.path.join(self.path, DOCS_FILE)
+            # 임시 파일에 쓴 뒤 교체해 읽는 쪽이 반쯤 쓰인 파일을 보지 않게 한다
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(self._matrix[keep], dtype=self.dtype))
+            with open(docs_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "ids": [self._ids[i] for i in keep],
+                        "texts": [self._texts[i] for i in keep],
+                        "metadatas": [self._metadatas[i] for i in keep],
+                    },
+                    f,
+                    ensure_ascii=False,
+                )
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(docs_path + ".tmp", docs_path)
+            self._load()
+
+    def _rebuild_postings(self) -> None:
+        postings: dict[str, dict[Any, list[int]]] = {field: {} for field in self.INDEXED_FIELDS}
+        for row in np.flatnonzero(self._alive):
+            md = self._metadatas[row]
+            for field in self.INDEXED_FIELDS:
+                value = md.get(field)
+                if value is not None:
+                    postings[field].setdefault(value, []).append(int(row))
+        self._postings = {
+            field: {value: np.asarray(rows, dtype=np.int64) for value, rows in by_value.items()}
+            for field, by_value in postings.items()
+        }
+
+    # --- 쓰기 -------------------------------------------------------------
+    def upsert(self, ids: list[str], vectors, texts: list[str], metadatas: list[dict]) -> None:
+        """미리 계산된 벡터를 넣는다. 같은 id가 있으면 교체한다."""
+        if not ids:
+            return
+        vecs = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms == 0, 1, norms)
+        if self.dtype != np.float32:
+            # 저장 후 다시 불러온 값과 같은 점수가 나오도록 저장 형식의 정밀도로 맞춘다
+            vecs = vecs.astype(self.dtype).astype(np.float32)
+        with self._lock:
+            matrix = np.array(self._matrix) if isinstance(self._matrix, np.memmap) else self._matrix
+            if matrix.size == 0:
+                matrix = np.zeros((0, vecs.shape[1]), dtype=np.float32)
+            new_rows = []
+            for i, doc_id in enumerate(ids):
+                row = self._row_of.get(doc_id)
+                if row is None:
+                    new_rows.append(i)
+                    continue
+                matrix[row] = vecs[i]
+                self._texts[row] = texts[i]
+                self._metadatas[row] = dict(metadatas[i])
+            if new_rows:
+                start = matrix.shape[0]
+                matrix = np.vstack([matrix, vecs[new_rows]])
+                self._alive = np.concatenate([self._alive, np.ones(len(new_rows), dtype=bool)])
+                for offset, i in enumerate(new_rows):
+                    self._ids.append(ids[i])
+                    self._texts.append(texts[i])
+                    self._metadatas.append(dict(metadatas[i]))
+                    self._row_of[ids[i]] = start + offset
+            self._matrix = matrix
+            self._rebuild_postings()
+            self._dirty = True
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        if self._embedding is None:
+            raise ValueError("LocalVectorIndex.add_texts requires an embedding model")
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"doc-{len(self._ids) + i}" for i in range(len(texts))]
+        self.upsert(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool:
+        with self._lock:
+            for doc_id in ids or []:
+                row = self._row_of.pop(doc_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._dirty = True
+            self._rebuild_postings()
+        return True
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding, metadatas: list[dict] | None = None, *, path: str = "", **kwargs: Any) -> "LocalVectorIndex":
+        store = cls(path, embedding=embedding, dtype=kwargs.pop("dtype", "float32"))
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
+
+    # --- 읽기 -------------------------------------------------------------
+    def values(self, field: str, filter: dict | None = None) -> list:
+        """메타데이터 필드의 고유 값 목록. filter가 있으면 그 조건에 맞는 행만 본다."""
+        self.reload_if_changed()
+        if not filter and field in self._postings:
+            return list(self._postings[field].keys())
+        rows = self._candidate_rows(filter)
+        if rows is None:
+            rows = np.flatnonzero(self._alive)
+        seen = dict.fromkeys(self._metadatas[r].get(field) for r in rows)
+        return [v for v in seen if v is not None]
+
+    def iter_metadata(self):
+        self.reload_if_changed()
+        for row in np.flatnonzero(self._alive):
+            yield self._metadatas[row]
+
+    def _snapshot(self) -> tuple:
+        # 검색 도중 다시 불러와도 한 검색 안에서는 같은 상태를 보도록 참조를 한 번에 잡아 둔다
+        with self._lock:
+            return self._ids, self._texts, self._metadatas, self._matrix, self._alive, self._postings
+
+    def _candidate_rows(self, filter: dict | None, state: tuple | None = None) -> np.ndarray | None:
+        """필터에 맞는 행 번호. None이면 전체(살아 있는 행)."""
+        if not filter:
+            return None
+        _, _, metadatas, _, alive, postings = state or self._snapshot()
+        rows = None
+        for field, cond in filter.items():
+            if isinstance(cond, dict):
+                values = cond.get("$in") or ([cond["$eq"]] if "$eq" in cond else [])
+            else:
+                values = [cond]
+            if field in postings:
+                by_value = postings[field]
+                matched = np.unique(np.concatenate([by_value.get(v, _EMPTY_ROWS) for v in values] or [_EMPTY_ROWS]))
+            else:
+                base = rows if rows is not None else np.flatnonzero(alive)
+                matched = np.asarray([r for r in base if metadatas[r].get(field) in values], dtype=np.int64)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+            if rows.size == 0:
+                break
+        return rows
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], *, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        self.reload_if_changed()
+        return self._search(embedding, k, filter)
+
+    def _search(self, embedding: list[float], k: int, filter: dict | None) -> list[tuple[Document, float]]:
+        state = self._snapshot()
+        return self._score(embedding, k, state, self._candidate_rows(filter, state))
+
+    def _score(self, embedding: list[float], k: int, state: tuple, rows: np.ndarray | None) -> list[tuple[Document, float]]:
+        ids, texts, metadatas, matrix, alive, _ = state
+        if matrix.size == 0:
+            return []
+        q = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm:
+            q = q / norm
+        if rows is None:
+            # 필터가 없으면 전체 행렬을 한 번에 곱하고 삭제된 행만 제외한다
+            rows = np.arange(matrix.shape[0])
+            scores = np.where(alive, matrix @ q, -np.inf)
+            k = min(k, int(alive.sum()))
+        else:
+            contiguous = rows.size and rows[-1] - rows[0] + 1 == rows.size
+            block = matrix[rows[0]:rows[-1] + 1] if contiguous else matrix[rows]
+            scores = block @ q
+            k = min(k, rows.size)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (
+                Document(id=ids[rows[i]], page_content=texts[rows[i]], metadata=dict(metadatas[rows[i]])),
+                float(scores[i]),
+            )
+            for i in top
+        ]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    # 다시 불러오기(docs.json 전체 읽기)는 스레드에서 한다. 점수 계산은 색인된 필드로 좁힌 후보가
+    # INLINE_SCORE_MAX 원소 이하일 때만 바로 실행하고, 필터 없는 전체 검색(30k x 3072이면 수십 ms)이나
+    # 색인되지 않은 필드 필터(행마다 파이썬 비교)는 스레드에서 실행해 이벤트 루프를 막지 않는다
+    async def asimilarity_search_by_vector_with_score(self, embedding: list[float], *, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        if self._changed_on_disk():
+            await asyncio.to_thread(self.reload_if_changed)
+        state = self._snapshot()
+        if filter and all(field in state[5] for field in filter):
+            rows = self._candidate_rows(filter, state)
+            if rows.size * state[3].shape[1] <= self.INLINE_SCORE_MAX:
+                return self._score(embedding, k, state, rows)
+            return await asyncio.to_thread(self._score, embedding, k, state, rows)
+        return await asyncio.to_thread(self._search, embedding, k, filter)
+
+    async def asimilarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
@@ -1,68 +1,244 @@
-# backend/main.py
-import os
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from dotenv import load_dotenv
-
-# NOTE: Avoid importing heavy RAG modules at startup. Use lazy, relative imports inside endpoints.
-
-app = FastAPI()
-
-# CORS 설정: 모든 도메인 허용 (개발/프론트 연동 편의)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], allow_credentials=True,
-    allow_methods=["*"], allow_headers=["*"],
-)
-
-# 환경변수 불러오기 (.env) - 루트 기준
-from pathlib import Path
-ROOT_DOTENV = Path(__file__).resolve().parents[1] / ".env"
-load_dotenv(dotenv_path=str(ROOT_DOTENV))
-
-# 검색 API용 요청 데이터 모델
-class SearchRequest(BaseModel):
-    query: str
-    file_name: str | None = None
-    category: str | None = None
-    answer_lang: str = "ko"
-
-
-# 검색 API (POST)
-@app.post("/api/search")
-def search_endpoint(req: SearchRequest):
-    try:
-        # 지연 임포트 (backend 패키지 기준 상대 임포트)
-        from .rag import rag_search
-        result = rag_search(
-            query=req.query,
-            file_name=req.file_name,
-            category=req.category,
-            answer_lang=req.answer_lang,
-            top_k=5,
-        )
-        return result
-    except Exception as e:
-        # 간단한 오류 메시지를 반환해 프론트에서 원인 확인 가능하도록 함
-        return {"error": str(e), "query": req.query, "file": req.file_name, "category": req.category}
-# main.py
-
-@app.get("/api/contracts")
-def list_contracts():
-    # Pinecone 인덱스에서 file_name 메타데이터를 수집하여 정렬 반환
-    # 지연 임포트 (backend 패키지 기준 상대 임포트)
-    try:
-        from .rag import list_all_file_names
-        files = list_all_file_names(category="contract")
-    except Exception:
-        files = []
-    if not files:
-        # 폴백: 기존 로컬 data 디렉토리 스캔
-        data_dir = os.path.join(os.path.dirname(__file__), "data")
-        try:
-            files = [f for f in os.listdir(data_dir) if f.endswith(".pdf")]
-        except Exception:
-            files = []
-        files.sort(key=lambda x: x.lower())
-    return {"contracts": files}
+# backend/main.py
+import asyncio
+import os
+import sys
+import json
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+from .catalog import get_catalog, start_refresher
+from .instrumentation import InstrumentationMiddleware, render_counter, render_gauge, render_metrics
+
+# NOTE: Avoid importing heavy RAG modules at startup. Use lazy, relative imports inside endpoints.
+
+CATALOG_REFRESH_SECONDS = float(os.getenv("RAG_CATALOG_REFRESH", "30"))
+CONTRACTS_CACHE_CONTROL = "public, max-age=60"
+
+
+def _on_catalog_change(file_names: set[str]):
+    # 다른 프로세스(ingest)가 다시 적재한 계약서의 캐시된 답변을 무효화
+    from .rag import get_answer_cache
+    for name in file_names:
+        get_answer_cache().invalidate_file(name)
+
+
+def _bootstrap_catalog():
+    from .rag import scan_index_catalog
+    return scan_index_catalog()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 토큰 계산용 tiktoken 인코딩: 첫 요청이 이벤트 루프에서 인코딩 파일을 내려받지 않도록 미리 불러온다
+    from .context import load_encoding
+    await asyncio.to_thread(load_encoding)
+    # 문서 카탈로그: 메모리에 올려 두고 백그라운드에서 변경 감지 (없으면 인덱스를 한 번 스캔해 생성)
+    stop = start_refresher(get_catalog(), CATALOG_REFRESH_SECONDS, _on_catalog_change, _bootstrap_catalog)
+    yield
+    stop.set()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# CORS 설정: 모든 도메인 허용 (개발/프론트 연동 편의)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"], allow_credentials=True,
+    allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+# 단계별 시간(Server-Timing 헤더)과 요청 지표 수집
+app.add_middleware(InstrumentationMiddleware)
+
+# 환경변수 불러오기 (.env) - 루트 기준
+from pathlib import Path
+ROOT_DOTENV = Path(__file__).resolve().parents[1] / ".env"
+load_dotenv(dotenv_path=str(ROOT_DOTENV))
+
+# 검색 API용 요청 데이터 모델
+class SearchRequest(BaseModel):
+    query: str
+    file_name: str | None = None
+    category: str | None = None
+    answer_lang: str = "ko"
+
+
+# 검색 API (POST)
+# 비동기 경로: 검색은 동시에, LLM 응답은 스레드풀 워커를 점유하지 않고 대기
+@app.post("/api/search")
+async def search_endpoint(req: SearchRequest):
+    try:
+        # 지연 임포트 (backend 패키지 기준 상대 임포트)
+        from .rag import arag_search
+        result = await arag_search(
+            query=req.query,
+            file_name=req.file_name,
+            category=req.category,
+            answer_lang=req.answer_lang,
+            top_k=5,
+        )
+        return result
+    except Exception as e:
+        # 오류 본문은 그대로 두되 상태 코드로 실패를 드러낸다 (모니터링/프론트 모두 확인 가능)
+        return JSONResponse(
+            status_code=_error_status(e),
+            content={"error": str(e), "query": req.query, "file": req.file_name, "category": req.category},
+        )
+
+
+def _error_status(e: Exception) -> int:
+    # 타임아웃 504, 상위 API(OpenAI/Pinecone)의 한도 초과 503, 그 밖의 상위 API 오류 502, 나머지 500
+    if isinstance(e, TimeoutError):
+        return 504
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status == 429 or type(e).__name__ == "RateLimitError":
+        return 503
+    if isinstance(status, int) or type(e).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return 502
+    return 500
+
+
+def _sse(event: str, data: dict) -> str:
+    # Server-Sent Events 프레임 (한 줄 JSON이므로 data: 라인은 하나)
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# 스트리밍 검색 API (POST, text/event-stream)
+# 이벤트 순서: chunks(검색 결과) -> token(답변 조각, 반복) -> done(최종 메타데이터) | error
+@app.post("/api/search/stream")
+async def search_stream_endpoint(req: SearchRequest, request: Request):
+    from .rag import astream_rag_search
+
+    async def event_source():
+        events = astream_rag_search(
+            query=req.query,
+            file_name=req.file_name,
+            category=req.category,
+            answer_lang=req.answer_lang,
+            top_k=5,
+        )
+        try:
+            async for event, data in events:
+                # 클라이언트가 연결을 끊으면 LLM 생성을 즉시 중단
+                if await request.is_disconnected():
+                    break
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"error": str(e), "query": req.query, "file": req.file_name, "category": req.category})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BatchSearchRequest(BaseModel):
+    questions: list[str]
+    file_name: str
+    category: str | None = None
+    answer_lang: str = "ko"
+
+
+# 배치 검색 API (POST, application/x-ndjson)
+# 한 계약서에 대한 질문 목록을 받아 질문별 결과를 끝나는 순서대로 한 줄씩 보낸다.
+# 각 줄은 rag_search 결과 + index(요청 목록에서의 위치), 실패하거나 빈 질문은 {"index", "question", "error"}.
+# 마지막 줄은 {"summary": {"total", "ok", "errors", "elapsed_s"}}
+@app.post("/api/search/batch")
+async def search_batch_endpoint(req: BatchSearchRequest, request: Request):
+    from .batch import BATCH_MAX_QUESTIONS, abatch_rag_search
+
+    questions = req.questions
+    if not any(q and q.strip() for q in questions):
+        raise HTTPException(status_code=400, detail="questions must contain at least one non-empty question")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    async def lines():
+        t0 = time.perf_counter()
+        ok = errors = 0
+        items = abatch_rag_search(
+            questions,
+            file_name=req.file_name,
+            category=req.category,
+            answer_lang=req.answer_lang,
+            top_k=5,
+        )
+        try:
+            async for item in items:
+                if await request.is_disconnected():
+                    break
+                if "error" in item:
+                    errors += 1
+                else:
+                    ok += 1
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            summary = {"total": len(questions), "ok": ok, "errors": errors, "elapsed_s": round(time.perf_counter() - t0, 3)}
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# main.py
+
+@app.get("/api/contracts")
+async def list_contracts(request: Request, category: str | None = "contract"):
+    # 메모리의 문서 카탈로그에서 바로 응답 (ETag가 같으면 304)
+    catalog = get_catalog()
+    if len(catalog):
+        etag, body = catalog.response(category or None)
+        headers = {"ETag": etag, "Cache-Control": CONTRACTS_CACHE_CONTROL}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    # 폴백: 카탈로그가 아직 없으면 기존 로컬 data 디렉토리 스캔
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    try:
+        files = [f for f in os.listdir(data_dir) if f.endswith(".pdf")]
+    except Exception:
+        files = []
+    files.sort(key=lambda x: x.lower())
+    return {"contracts": files}
+
+
+def _built(getter) -> bool:
+    # lru_cache 게터가 이미 객체를 만들었는지 (교체된 게터는 그대로 호출)
+    info = getattr(getter, "cache_info", None)
+    return info is None or info().currsize > 0
+
+
+# Prometheus 지표 (텍스트 형식). 단계별/요청별 지연 히스토그램, 단계별 오류 수, LLM 토큰 수, 캐시 적중/미스 수
+@app.get("/metrics")
+async def metrics():
+    extra: list[str] = []
+    rag = sys.modules.get(f"{__package__}.rag")
+    if rag is not None:
+        # 이미 만들어진 캐시만 읽는다 (지표 수집이 임베딩 클라이언트 등을 생성하지 않도록)
+        caches = {}
+        if _built(rag.get_answer_cache):
+            caches["answer"] = rag.get_answer_cache().stats()
+        if _built(rag.get_query_embedder):
+            caches["embedding"] = rag.get_query_embedder().stats()
+        if caches:
+            # 적중률은 rate(rag_cache_hits_total) / (rate(hits) + rate(misses))로 구간별로 계산한다
+            extra += render_counter("rag_cache_hits_total", "Cache hits (incl. disk, semantic, coalesced).", "cache",
+                                    {name: st["hits"] + st.get("disk_hits", 0) + st.get("semantic_hits", 0) + st.get("coalesced", 0)
+                                     for name, st in caches.items()})
+            extra += render_counter("rag_cache_misses_total", "Cache misses.", "cache",
+                                    {name: st["misses"] for name, st in caches.items()})
+            extra += render_gauge("rag_cache_entries", "Entries held in memory.", "cache",
+                                  {name: st["size"] for name, st in caches.items()})
+    extra += render_gauge("rag_catalog_documents", "Documents in the in-memory catalog.", "catalog", {"all": len(get_catalog())})
+    return PlainTextResponse(render_metrics(extra), media_type="text/plain; version=0.0.4")
@@ -1,245 +1,627 @@
-import os
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-try:
-    from pinecone import Pinecone  # new SDK
-except Exception:
-    Pinecone = None  # optional, fall back to sampling
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.prompts import PromptTemplate
-from dotenv import load_dotenv
-
-def load_system_prompt(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
-
-# 환경변수 불러오기 (프로젝트 루트와 backend 폴더 모두 시도)
-PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
-load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, ".env"))
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY_KIM")
-PINECONE_INDEX = os.getenv("PINECONE_INDEX_KIM")
-PINECONE_ENV = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_NAMESPACE = ""
-
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
-os.environ["PINECONE_ENVIRONMENT"] = PINECONE_ENV
-
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-large",
-    openai_api_key=OPENAI_API_KEY
-)
-vectorstore = PineconeVectorStore.from_existing_index(
-    index_name=PINECONE_INDEX,
-    embedding=embeddings,
-    namespace=PINECONE_NAMESPACE,
-)
-
-# system_prompt.txt 절대경로
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-system_prompt_path = os.path.join(DATA_DIR, "system_prompt.txt")
-system_prompt = load_system_prompt(system_prompt_path)
-prompt_template = (
-    "{system_prompt}\n\n"
-    "Question: {question}\n"
-    "Context (chunks/clauses):\n{context}\n\n"
-    "Output language: {answer_lang}. Write the entire answer in this language only.\n"
-    "Important context rule: Items are tagged as [CONTRACT] (selected agreement) and [LAW] (latest legislation).\n"
-    "Treat all [LAW] items as up-to-date and authoritative legal references.\n"
-    "If the question concerns law or when [LAW] appears in context, explicitly compare the contract clauses against the latest legislation: identify alignment, discrepancies, and whether any contract provision is overridden by mandatory law.\n"
-    "Where the contract text cites outdated statutes, treat [LAW] as controlling for the legal requirement; still ground obligations and remedies primarily in [CONTRACT].\n"
-    "Summarize the comparison outcome in the first paragraph. In the evidence list, pair citations from both sources where relevant.\n\n"
-    "Citation style (STRICT): Use only the file name and pages inside parentheses, no tags.\n"
-    "Format exactly as: (DocumentName, p.X[, p.Y ...]) — e.g., (contract3.pdf, p.7), (law1.pdf, p.18, p.28).\n"
-    "Use the exact file name as DocumentName. Prefix each page with 'p.'. Place a single space after each comma.\n"
-    "Do not include any tags or extra markers in citations (no [CONTRACT], [LAW], brackets, or dashes). Use only (DocumentName, p.…).\n\n"
-    "Respond in exactly three distinct paragraphs, in this order:\n"
-    "- First, provide a concise summary answer.\n"
-    "- Next, present all supporting clause/page/quotation evidence (one per line, as a list, direct from the context).\n"
-    "- Finally, offer concrete practical advice or analysis for the user's position, based only on the quoted clauses.\n"
-    "If the user's question contains the exact Korean word '도식화', then AFTER the above three paragraphs, append one additional section at the very end with the exact header line below (do NOT translate this header):\n"
-    "【도식화 구조 제안】\n"
-    "In that section, do NOT draw a full diagram. Instead, provide a detailed plan for how to visualize it: (1) Node list with labels and 1-line descriptions; (2) Edge list describing directions and conditions; (3) Recommended layout (top-down/left-right) and ordering; (4) Grouping/clusters and boundaries; (5) Legend/notations to use; and (6) Optional short ASCII sketch up to 6 lines.\n"
-    "For the optional ASCII sketch: use ONLY plain ASCII characters '-', '>', '(', ')', '[', ']', ':' and spaces; format each line as either 'A -> B' or '- Node: short note'; do NOT attempt alignment, boxes, or grids; do NOT use code fences or Markdown; keep labels in {answer_lang}.\n"
-    "\nTerminology policy (STRICT): For the following industry terms, do NOT translate the term itself.\n"
-    "Always write the original term exactly as in the source (case preserved). On the first occurrence, immediately add a translation or clarifying note in parentheses in the user's requested output language ({answer_lang}); on later occurrences, the parentheses are optional. Never use any other language in parentheses.\n"
-    "Terms: Operator; Non-Operator; Participating Interest; Joint Operating Agreement; Production Sharing Agreement; Cost Oil; Cost Gas; Profit Oil; Profit Gas; Exclusive Operation; Work Program and Budget; AFE; Carried Interest; Relinquishment; Surrender; Defaulting Party; Force Majeure; Assignment; Withdrawal; Entitlement; Lifting; Take or Pay; Make Up Gas; Joint Account; Gross Negligence/Willful Misconduct; Abandonment; Development Plan; Appraisal Well; Exploration Well; Royalty; Additional Profits Tax (APT); Joint Operating Committee (JOC).\n"
-    "Example format (use these exact visual headers, not Markdown):\n"
-    "【답변 요약】\n(Your summary here)\n\n"
-    "【근거】\n(Clause numbers/pages/quotes with citations)\n\n"
-    "【실무적 조언】\n(Your advice here)\n"
-    "Insert one blank line after each header.\n"
-    "Do not add section numbers or extra labels ('1.', '2.', etc). Use only the three specified headers and line breaks to separate each part, EXCEPT when the question contains '도식화'—in that case, add the single extra section at the very end for the schematic structure proposal."
-)
-prompt = PromptTemplate.from_template(prompt_template)
-llm = ChatOpenAI(model="gpt-4.1", openai_api_key=OPENAI_API_KEY, temperature=0)
-
-# 법령 키워드 감지
-LAW_KEYWORDS = [
-    "법", "법령", "law", "legislation"
-]
-
-def _contains_law_keyword(text: str) -> bool:
-    if not text:
-        return False
-    lowered = text.lower()
-    if any(k in text for k in ["법", "법령"]):
-        return True
-    return any(k in lowered for k in ["law", "legislation"]) 
-
-def rag_search(query, file_name=None, category=None, answer_lang="ko", top_k=5):
-    # 1) 계약서 검색: 선택한 계약서는 항상 포함
-    contract_docs: list = []
-    if file_name:
-        contract_docs = vectorstore.similarity_search(
-            query, k=top_k, filter={"file_name": file_name}
-        )
-    else:
-        # 파일이 지정되지 않으면 우선 필터 없이 전체에서 검색
-        all_docs = vectorstore.similarity_search(
-            query, k=top_k, filter=None
-        )
-        # 계약서 추정 규칙: category=='contract' 이거나 파일명이 contract로 시작
-        contract_docs = [
-            d for d in all_docs
-            if (d.metadata.get("category") == "contract")
-            or str(d.metadata.get("file_name", "")).lower().startswith("contract")
-        ]
-        # 계약서로 추정되는 문서가 없으면 전체 결과라도 반환
-        if not contract_docs:
-            contract_docs = all_docs
-
-    # 2) 법령 키워드가 있고 특정 계약서가 선택된 경우에만 law 카테고리를 비교용으로 추가
-    add_law = bool(file_name) and (_contains_law_keyword(query) or (category == "law"))
-    law_docs: list = []
-    if add_law:
-        law_docs = vectorstore.similarity_search(
-            query, k=top_k, filter={"category": "law"}
-        )
-
-    # 3) 컨텍스트 병합: 계약서 우선, 다음 법령
-    docs = contract_docs + law_docs
-    def _line_for(doc):
-        src_cat = doc.metadata.get("category")
-        src_file = doc.metadata.get("file_name")
-        raw_page = doc.metadata.get("page_num")
-        try:
-            page_num = int(raw_page) if raw_page is not None else 0
-        except Exception:
-            page_num = 0
-        src_tag = "CONTRACT" if (src_cat == "contract" or (file_name and src_file == file_name)) else ("LAW" if src_cat == "law" else (src_cat or "SRC"))
-        return f"- [{src_tag}] [{src_file or '알수없음'} p.{page_num}] {doc.page_content}"
-
-    context = "\n".join([_line_for(doc) for doc in docs])
-    prompt_txt = prompt.format(
-        system_prompt=system_prompt,
-        question=query,
-        context=context,
-        answer_lang=answer_lang,
-    )
-
-    # 🔥 요청된 언어로 직접 생성 (용어/괄호 언어 일관성 보장)
-    answer = llm.invoke(prompt_txt).content.strip()
-
-    # 청크 미리보기 리스트
-    chunk_previews = []
-    for i, chunk in enumerate(docs, 1):
-        file_ = chunk.metadata.get("file_name", "알수없음")
-        raw_page = chunk.metadata.get("page_num")
-        try:
-            page_ = int(raw_page) if raw_page is not None else 0
-        except Exception:
-            page_ = 0
-        cat_ = chunk.metadata.get("category", "미지정")
-        text = chunk.page_content.replace("\n", " ")
-        preview = text[:180]
-        src_tag = "CONTRACT" if (cat_ == "contract" or (file_name and file_ == file_name)) else ("LAW" if cat_ == "law" else (cat_ or "SRC"))
-        chunk_previews.append(
-            f"{i}. [{src_tag}] [{file_} / p.{page_}] {preview}{'...' if len(text) > 180 else ''}"
-        )
-    return {
-        "question": query,
-        "answer": answer,
-        "file": file_name or "전체 계약서",
-        "category": ("law" if add_law else (category or "전체")),
-        "preview_chunks": chunk_previews,
-    }
-
-
-# 신뢰성(Confidence) 관련 로직은 사용되지 않아 제거되었습니다.
-
-
-def list_index_file_names(category: str | None = None, top_k: int = 1000) -> list[str]:
-    """Pinecone 벡터 인덱스에서 메타데이터의 file_name 값을 수집해 정렬된 유니크 리스트로 반환한다.
-
-    전략: 중립 쿼리로 상위 k개를 조회해 file_name을 수집한다. 인덱스 규모가 작을 때 실용적이다.
-    필요 시 k를 조정해 커버리지를 늘릴 수 있다.
-    """
-    filter_dict = {"category": category} if category else None
-    try:
-        docs = vectorstore.similarity_search(" ", k=top_k, filter=filter_dict)
-    except Exception:
-        # 임베딩/모델 오류 시 빈 리스트 반환
-        return []
-    names = []
-    seen = set()
-    for doc in docs:
-        name = (doc.metadata or {}).get("file_name")
-        if name and name not in seen:
-            seen.add(name)
-            names.append(name)
-    names.sort(key=lambda x: x.lower())
-    return names
-
-
-def list_all_file_names(category: str | None = None) -> list[str]:
-    """Pinecone의 list API를 이용해 모든 벡터를 페이지네이션으로 순회하며 file_name을 수집한다.
-    가능한 경우 이 경로를 사용하고, 실패 시 list_index_file_names로 폴백한다.
-    """
-    if Pinecone is None or not PINECONE_API_KEY or not PINECONE_INDEX:
-        return list_index_file_names(category=category, top_k=2000)
-
-    try:
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        index = pc.Index(PINECONE_INDEX)
-        file_names: set[str] = set()
-        token = None
-        while True:
-            # 다양한 SDK 버전을 호환하기 위해 kwargs를 유연하게 전달
-            kwargs = {"limit": 1000, "include_values": False, "include_metadata": True}
-            if PINECONE_NAMESPACE:
-                kwargs["namespace"] = PINECONE_NAMESPACE
-            if token:
-                kwargs["pagination_token"] = token
-            resp = index.list(**kwargs)
-
-            # resp가 dict 또는 객체일 수 있음
-            vectors = None
-            if isinstance(resp, dict):
-                vectors = resp.get("vectors") or resp.get("data")
-                token = (resp.get("pagination") or {}).get("next") or resp.get("pagination_token")
-            else:
-                vectors = getattr(resp, "vectors", None) or getattr(resp, "data", None) or resp
-                token = getattr(resp, "pagination_token", None) or getattr(resp, "next", None)
-
-            if not vectors:
-                break
-            for v in vectors:
-                md = getattr(v, "metadata", None)
-                if md is None and isinstance(v, dict):
-                    md = v.get("metadata")
-                name = (md or {}).get("file_name")
-                if name:
-                    file_names.add(name)
-            if not token:
-                break
-        names = sorted(file_names, key=lambda x: x.lower())
-        # 필터 요청 시 적용
-        if category:
-            # list API 호출에서 메타 필터를 못 걸 경우를 대비한 후처리(추정)
-            names = [n for n in names if n]
-        return names
-    except Exception:
-        # 어떤 이유로든 실패하면 샘플링 폴백
-        return list_index_file_names(category=category, top_k=5000)
+import asyncio
+import os
+import weakref
+from functools import lru_cache
+from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+try:
+    from pinecone import Pinecone  # new SDK
+except Exception:
+    Pinecone = None  # optional, fall back to sampling
+from langchain_pinecone import PineconeVectorStore
+from langchain_core.prompts import PromptTemplate
+from dotenv import load_dotenv
+from .answer_cache import AnswerCache
+from .context import count_tokens, pack_context
+from .embedding_cache import QueryEmbeddingCache
+from .instrumentation import record_chunks, record_usage, stage
+from .lexical import LexicalIndex, parse_clause_reference, reciprocal_rank_fusion
+from .local_index import LocalVectorIndex
+
+def load_system_prompt(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+# 환경변수 불러오기 (프로젝트 루트와 backend 폴더 모두 시도)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, ".env"))
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY_KIM")
+PINECONE_INDEX = os.getenv("PINECONE_INDEX_KIM")
+PINECONE_ENV = os.getenv("PINECONE_ENVIRONMENT")
+PINECONE_NAMESPACE = ""
+# 벡터 저장소 선택: "pinecone"(기본) 또는 "local"(프로세스 내 NumPy 인덱스)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "pinecone").lower()
+LOCAL_INDEX_DIR = os.getenv("RAG_LOCAL_INDEX_DIR") or os.path.join(os.path.dirname(__file__), "data", "index")
+LOCAL_INDEX_DTYPE = os.getenv("RAG_LOCAL_INDEX_DTYPE", "float32")
+# 검색 방식: "hybrid"(벡터 + BM25 융합, 조항 번호 직접 조회) 또는 "vector"
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").lower()
+CHUNK_STORE_PATH = os.getenv("RAG_CHUNK_STORE") or os.path.join(LOCAL_INDEX_DIR, "chunks.json")
+
+# 값이 없는 키는 건너뛴다 (None 대입 시 임포트 단계에서 TypeError 발생)
+for _env_name, _env_value in (
+    ("OPENAI_API_KEY", OPENAI_API_KEY),
+    ("PINECONE_API_KEY", PINECONE_API_KEY),
+    ("PINECONE_ENVIRONMENT", PINECONE_ENV),
+):
+    if _env_value:
+        os.environ[_env_name] = _env_value
+
+
+# 외부 클라이언트는 첫 사용 시점에 생성한다.
+# 임포트만으로 네트워크/자격증명이 필요하지 않으므로 가짜 모델로 오프라인 테스트가 가능하다.
+@lru_cache(maxsize=1)
+def get_embeddings():
+    return OpenAIEmbeddings(
+        model="text-embedding-3-large",
+        openai_api_key=OPENAI_API_KEY
+    )
+
+
+@lru_cache(maxsize=1)
+def get_query_embedder() -> QueryEmbeddingCache:
+    # 요청 내/요청 간 쿼리 벡터 재사용 (RAG_EMBED_CACHE_PATH 지정 시 디스크에도 보존)
+    return QueryEmbeddingCache(
+        get_embeddings(),
+        model="text-embedding-3-large",
+        max_entries=int(os.getenv("RAG_EMBED_CACHE_SIZE", "2048")),
+        path=os.getenv("RAG_EMBED_CACHE_PATH") or None,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> AnswerCache:
+    # RAG_ANSWER_CACHE_SIZE=0 이면 비활성. semantic 모드는 명시적으로 켜야 한다
+    return AnswerCache(
+        ttl=float(os.getenv("RAG_ANSWER_CACHE_TTL", "600")),
+        max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "512")),
+        semantic=os.getenv("RAG_ANSWER_CACHE_SEMANTIC", "0") == "1",
+        threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.97")),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_lexical_index() -> LexicalIndex:
+    return LexicalIndex(CHUNK_STORE_PATH)
+
+
+@lru_cache(maxsize=1)
+def get_vectorstore():
+    if VECTOR_BACKEND == "local":
+        # 임베딩은 검색 시 get_query_embedder가 담당하므로 자격증명 없이도 열 수 있다
+        return LocalVectorIndex(LOCAL_INDEX_DIR, dtype=LOCAL_INDEX_DTYPE)
+    if VECTOR_BACKEND != "pinecone":
+        raise ValueError(f"Unknown RAG_VECTOR_BACKEND: {VECTOR_BACKEND!r} (expected 'pinecone' or 'local')")
+    return PineconeVectorStore.from_existing_index(
+        index_name=PINECONE_INDEX,
+        embedding=get_embeddings(),
+        namespace=PINECONE_NAMESPACE,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_llm():
+    # stream_usage: 스트리밍 응답에도 토큰 사용량(usage_metadata)을 받는다
+    return ChatOpenAI(model="gpt-4.1", openai_api_key=OPENAI_API_KEY, temperature=0, stream_usage=True)
+
+# system_prompt.txt 절대경로
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+system_prompt_path = os.path.join(DATA_DIR, "system_prompt.txt")
+system_prompt = load_system_prompt(system_prompt_path)
+prompt_template = (
+    "Important context rule: Items are tagged as [CONTRACT] (selected agreement) and [LAW] (latest legislation).\n"
+    "Treat all [LAW] items as up-to-date and authoritative legal references.\n"
+    "If the question concerns law or when [LAW] appears in context, explicitly compare the contract clauses against the latest legislation: identify alignment, discrepancies, and whether any contract provision is overridden by mandatory law.\n"
+    "Where the contract text cites outdated statutes, treat [LAW] as controlling for the legal requirement; still ground obligations and remedies primarily in [CONTRACT].\n"
+    "Summarize the comparison outcome in the first paragraph. In the evidence list, pair citations from both sources where relevant.\n\n"
+    "Citation style (STRICT): Use only the file name and pages inside parentheses, no tags.\n"
+    "Format exactly as: (DocumentName, p.X[, p.Y ...]) — e.g., (contract3.pdf, p.7), (law1.pdf, p.18, p.28).\n"
+    "Use the exact file name as DocumentName. Prefix each page with 'p.'. Place a single space after each comma.\n"
+    "Do not include any tags or extra markers in citations (no [CONTRACT], [LAW], brackets, or dashes). Use only (DocumentName, p.…).\n\n"
+    "Respond in exactly three distinct paragraphs, in this order:\n"
+    "- First, provide a concise summary answer.\n"
+    "- Next, present all supporting clause/page/quotation evidence (one per line, as a list, direct from the context).\n"
+    "- Finally, offer concrete practical advice or analysis for the user's position, based only on the quoted clauses.\n"
+    "If the user's question contains the exact Korean word '도식화', then AFTER the above three paragraphs, append one additional section at the very end with the exact header line below (do NOT translate this header):\n"
+    "【도식화 구조 제안】\n"
+    "In that section, do NOT draw a full diagram. Instead, provide a detailed plan for how to visualize it: (1) Node list with labels and 1-line descriptions; (2) Edge list describing directions and conditions; (3) Recommended layout (top-down/left-right) and ordering; (4) Grouping/clusters and boundaries; (5) Legend/notations to use; and (6) Optional short ASCII sketch up to 6 lines.\n"
+    "For the optional ASCII sketch: use ONLY plain ASCII characters '-', '>', '(', ')', '[', ']', ':' and spaces; format each line as either 'A -> B' or '- Node: short note'; do NOT attempt alignment, boxes, or grids; do NOT use code fences or Markdown; keep labels in the output language.\n"
+    "\nTerminology policy (STRICT): For the following industry terms, do NOT translate the term itself.\n"
+    "Always write the original term exactly as in the source (case preserved). On the first occurrence, immediately add a translation or clarifying note in parentheses in the user's requested output language; on later occurrences, the parentheses are optional. Never use any other language in parentheses.\n"
+    "Terms: Operator; Non-Operator; Participating Interest; Joint Operating Agreement; Production Sharing Agreement; Cost Oil; Cost Gas; Profit Oil; Profit Gas; Exclusive Operation; Work Program and Budget; AFE; Carried Interest; Relinquishment; Surrender; Defaulting Party; Force Majeure; Assignment; Withdrawal; Entitlement; Lifting; Take or Pay; Make Up Gas; Joint Account; Gross Negligence/Willful Misconduct; Abandonment; Development Plan; Appraisal Well; Exploration Well; Royalty; Additional Profits Tax (APT); Joint Operating Committee (JOC).\n"
+    "Example format (use these exact visual headers, not Markdown):\n"
+    "【답변 요약】\n(Your summary here)\n\n"
+    "【근거】\n(Clause numbers/pages/quotes with citations)\n\n"
+    "【실무적 조언】\n(Your advice here)\n"
+    "Insert one blank line after each header.\n"
+    "Do not add section numbers or extra labels ('1.', '2.', etc). Use only the three specified headers and line breaks to separate each part, EXCEPT when the question contains '도식화'—in that case, add the single extra section at the very end for the schematic structure proposal.\n\n"
+)
+# 요청마다 바뀌는 부분(출력 언어, 컨텍스트, 질문)은 맨 뒤에 둔다.
+# 그 앞(system_prompt + 지시문)은 모든 요청에서 같은 접두부가 되어 OpenAI 프롬프트 캐시가 적중한다.
+prompt_prefix = system_prompt + "\n\n" + prompt_template
+request_template = (
+    "Output language: {answer_lang}. Write the entire answer in this language only.\n"
+    "Context (chunks/clauses):\n{context}\n\n"
+    "Question: {question}\n"
+)
+prompt = PromptTemplate.from_template(request_template)
+# 컨텍스트에 넣을 청크의 토큰 상한과 중복으로 보고 버릴 유사도(3-gram 겹침 비율)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("RAG_CONTEXT_DEDUP_THRESHOLD", "0.9"))
+
+# 비동기 경로 설정: 동시 LLM 호출 상한과 단계별 타임아웃(초)
+LLM_MAX_CONCURRENCY = int(os.getenv("RAG_LLM_MAX_CONCURRENCY", "64"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RAG_RETRIEVAL_TIMEOUT", "15"))
+LLM_TIMEOUT = float(os.getenv("RAG_LLM_TIMEOUT", "120"))
+# 세마포어는 처음 대기하는 이벤트 루프에 묶이므로 루프마다 따로 둔다 (asyncio.run을 여러 번 호출하는 경우)
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+# 법령 키워드 감지
+LAW_KEYWORDS = [
+    "법", "법령", "law", "legislation"
+]
+
+def _contains_law_keyword(text: str) -> bool:
+    if not text:
+        return False
+    lowered = text.lower()
+    if any(k in text for k in ["법", "법령"]):
+        return True
+    return any(k in lowered for k in ["law", "legislation"]) 
+
+def _retrieval_plan(query, file_name=None, category=None) -> tuple[dict | None, bool]:
+    """(계약서 검색 필터, 법령 추가 여부)를 결정한다."""
+    # 파일이 지정되지 않으면 우선 필터 없이 전체에서 검색
+    contract_filter = {"file_name": file_name} if file_name else None
+    # 법령 키워드가 있고 특정 계약서가 선택된 경우에만 law 카테고리를 비교용으로 추가
+    add_law = bool(file_name) and (_contains_law_keyword(query) or (category == "law"))
+    return contract_filter, add_law
+
+
+def _select_contract_docs(all_docs, file_name=None) -> list:
+    if file_name:
+        return all_docs
+    # 계약서 추정 규칙: category=='contract' 이거나 파일명이 contract로 시작
+    contract_docs = [
+        d for d in all_docs
+        if (d.metadata.get("category") == "contract")
+        or str(d.metadata.get("file_name", "")).lower().startswith("contract")
+    ]
+    # 계약서로 추정되는 문서가 없으면 전체 결과라도 반환
+    return contract_docs or all_docs
+
+
+def _clause_lookup(query, file_name, top_k) -> list:
+    # 조항 번호만 묻는 질문("Article 12.3", "제12조")은 어휘 색인에서 바로 찾는다
+    ref = parse_clause_reference(query)
+    if ref is None:
+        return []
+    with stage("lexical"):
+        return get_lexical_index().find_clause(ref, file_name, k=top_k)
+
+
+def _fuse(query, file_name, vector_docs, top_k) -> list:
+    # 벡터 결과와 BM25 결과를 RRF로 합친다 (어휘 색인에 없는 계약서는 벡터 결과 그대로)
+    with stage("lexical"):
+        lexical_docs = get_lexical_index().search(query, file_name, k=max(len(vector_docs), top_k))
+    if not lexical_docs:
+        return vector_docs[:top_k]
+    return reciprocal_rank_fusion([vector_docs, lexical_docs], top_k=top_k)
+
+
+def _retrieve(query, file_name=None, category=None, top_k=5):
+    """계약서(및 필요 시 법령) 청크를 검색해 (docs, add_law)를 반환한다."""
+    vectorstore = get_vectorstore()
+    contract_filter, add_law = _retrieval_plan(query, file_name, category)
+    hybrid = RETRIEVAL_MODE == "hybrid" and bool(file_name)
+    if hybrid and not add_law:
+        clause_docs = _clause_lookup(query, file_name, top_k)
+        if clause_docs:
+            return clause_docs, add_law
+    # 쿼리는 요청당 한 번만 임베딩하고 모든 검색에서 같은 벡터를 사용
+    with stage("embed"):
+        query_vector = get_query_embedder().embed(query)
+    with stage("vector_query"):
+        # 1) 계약서 검색: 선택한 계약서는 항상 포함 (융합 시 후보를 두 배로)
+        contract_docs = _select_contract_docs(
+            vectorstore.similarity_search_by_vector(
+                query_vector, k=top_k * 2 if hybrid else top_k, filter=contract_filter
+            ),
+            file_name,
+        )
+        # 2) 법령 비교용 검색
+        law_docs: list = []
+        if add_law:
+            law_docs = vectorstore.similarity_search_by_vector(
+                query_vector, k=top_k, filter={"category": "law"}
+            )
+    if hybrid:
+        contract_docs = _fuse(query, file_name, contract_docs, top_k)
+    # 3) 컨텍스트 병합: 계약서 우선, 다음 법령
+    return contract_docs + law_docs, add_law
+
+
+async def _with_timeout(stage_name: str, awaitable, timeout: float):
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{stage_name} timed out after {timeout:g}s") from None
+
+
+async def _aretrieve(query, file_name=None, category=None, top_k=5, query_vector=None):
+    """_retrieve의 비동기 버전. 계약서/법령 검색을 동시에 실행한다.
+
+    query_vector를 넘기면(배치에서 미리 임베딩한 경우) 임베딩 단계를 건너뛴다.
+    """
+    vectorstore = get_vectorstore()
+    contract_filter, add_law = _retrieval_plan(query, file_name, category)
+    hybrid = RETRIEVAL_MODE == "hybrid" and bool(file_name)
+    # 어휘 색인은 처음(그리고 ingest 후) chunks.json 전체를 읽고 BM25를 만들므로 이벤트 루프 밖에서 실행한다
+    if hybrid and not add_law:
+        clause_docs = await asyncio.to_thread(_clause_lookup, query, file_name, top_k)
+        if clause_docs:
+            return clause_docs, add_law
+    if query_vector is None:
+        with stage("embed"):
+            query_vector = await _with_timeout("embedding", get_query_embedder().aembed(query), RETRIEVAL_TIMEOUT)
+    searches = [
+        vectorstore.asimilarity_search_by_vector(query_vector, k=top_k * 2 if hybrid else top_k, filter=contract_filter)
+    ]
+    if add_law:
+        searches.append(vectorstore.asimilarity_search_by_vector(query_vector, k=top_k, filter={"category": "law"}))
+    with stage("vector_query"):
+        results = await _with_timeout("retrieval", asyncio.gather(*searches), RETRIEVAL_TIMEOUT)
+    contract_docs = _select_contract_docs(results[0], file_name)
+    if hybrid:
+        contract_docs = await asyncio.to_thread(_fuse, query, file_name, contract_docs, top_k)
+    law_docs = results[1] if add_law else []
+    return contract_docs + law_docs, add_law
+
+
+def _page_of(doc) -> int:
+    raw_page = doc.metadata.get("page_num")
+    try:
+        return int(raw_page) if raw_page is not None else 0
+    except Exception:
+        return 0
+
+
+def _source_tag(category, src_file, file_name) -> str:
+    if category == "contract" or (file_name and src_file == file_name):
+        return "CONTRACT"
+    return "LAW" if category == "law" else (category or "SRC")
+
+
+@lru_cache(maxsize=1)
+def _prefix_tokens() -> int:
+    return count_tokens(prompt_prefix)
+
+
+def _build_prompt(query, docs, file_name=None, answer_lang="ko") -> tuple[str, list, int]:
+    """(프롬프트, 컨텍스트에 실제로 들어간 청크, 프롬프트 토큰 수)를 반환한다.
+
+    청크는 중복 제거·같은 페이지 병합 후 관련도 순으로 CONTEXT_TOKEN_BUDGET까지만 넣는다.
+    """
+    def _line_for(doc):
+        src_cat = doc.metadata.get("category")
+        src_file = doc.metadata.get("file_name")
+        src_tag = _source_tag(src_cat, src_file, file_name)
+        return f"- [{src_tag}] [{src_file or '알수없음'} p.{_page_of(doc)}] {doc.page_content}"
+
+    used_docs, context, _ = pack_context(docs, CONTEXT_TOKEN_BUDGET, _line_for, CONTEXT_DEDUP_THRESHOLD)
+    record_chunks(len(docs), len(used_docs))
+    request_txt = prompt.format(question=query, context=context, answer_lang=answer_lang)
+    return prompt_prefix + request_txt, used_docs, _prefix_tokens() + count_tokens(request_txt)
+
+
+def _preview_chunks(docs, file_name=None) -> list[str]:
+    # 청크 미리보기 리스트
+    chunk_previews = []
+    for i, chunk in enumerate(docs, 1):
+        file_ = chunk.metadata.get("file_name", "알수없음")
+        cat_ = chunk.metadata.get("category", "미지정")
+        text = chunk.page_content.replace("\n", " ")
+        preview = text[:180]
+        src_tag = _source_tag(cat_, file_, file_name)
+        chunk_previews.append(
+            f"{i}. [{src_tag}] [{file_} / p.{_page_of(chunk)}] {preview}{'...' if len(text) > 180 else ''}"
+        )
+    return chunk_previews
+
+
+def _sources(docs) -> list[dict]:
+    # 검색된 청크의 출처 (평가/클라이언트용). preview_chunks와 같은 순서
+    return [
+        {
+            "id": doc.id,
+            "file_name": doc.metadata.get("file_name"),
+            "category": doc.metadata.get("category"),
+            "page_num": _page_of(doc),
+            "text": doc.page_content,
+        }
+        for doc in docs
+    ]
+
+
+def _result_meta(query, file_name, category, add_law) -> dict:
+    return {
+        "question": query,
+        "file": file_name or "전체 계약서",
+        "category": ("law" if add_law else (category or "전체")),
+    }
+
+
+def rag_search(query, file_name=None, category=None, answer_lang="ko", top_k=5, llm=None):
+    # 같은 질문은 캐시에서 반환하고, 동시에 들어온 같은 질문은 한 번만 계산한다
+    cache = get_answer_cache()
+    key = cache.key(query, file_name, category, answer_lang, top_k)
+    query_vector = None
+    if cache.semantic:
+        with stage("embed"):
+            query_vector = get_query_embedder().embed(query)
+    result = cache.get_or_compute(
+        key,
+        lambda: _rag_search(query, file_name, category, answer_lang, top_k, llm),
+        query_vector=query_vector,
+    )
+    return {**result, "question": query}
+
+
+def _rag_search(query, file_name=None, category=None, answer_lang="ko", top_k=5, llm=None):
+    docs, add_law = _retrieve(query, file_name=file_name, category=category, top_k=top_k)
+    with stage("prompt_build"):
+        prompt_txt, docs, prompt_tokens = _build_prompt(query, docs, file_name=file_name, answer_lang=answer_lang)
+
+    # 🔥 요청된 언어로 직접 생성 (용어/괄호 언어 일관성 보장)
+    with stage("llm"):
+        message = (llm or get_llm()).invoke(prompt_txt)
+
+    return {
+        **_result_meta(query, file_name, category, add_law),
+        "answer": message.content.strip(),
+        "preview_chunks": _preview_chunks(docs, file_name),
+        "sources": _sources(docs),
+        "prompt_tokens": prompt_tokens,
+        # 공급자가 보고한 실제 사용량이 있으면 추정치(prompt_tokens)를 덮어쓴다
+        **record_usage(message),
+    }
+
+
+async def arag_search(query, file_name=None, category=None, answer_lang="ko", top_k=5, llm=None, query_vector=None):
+    """rag_search의 비동기 버전. 워커 스레드를 점유하지 않고 검색/생성을 기다린다."""
+    cache = get_answer_cache()
+    key = cache.key(query, file_name, category, answer_lang, top_k)
+    if query_vector is None and cache.semantic:
+        with stage("embed"):
+            query_vector = await _with_timeout("embedding", get_query_embedder().aembed(query), RETRIEVAL_TIMEOUT)
+    result = await cache.aget_or_compute(
+        key,
+        lambda: _arag_search(query, file_name, category, answer_lang, top_k, llm, query_vector),
+        query_vector=query_vector,
+    )
+    return {**result, "question": query}
+
+
+async def _arag_search(query, file_name=None, category=None, answer_lang="ko", top_k=5, llm=None, query_vector=None):
+    docs, add_law = await _aretrieve(
+        query, file_name=file_name, category=category, top_k=top_k, query_vector=query_vector
+    )
+    with stage("prompt_build"):
+        prompt_txt, docs, prompt_tokens = _build_prompt(query, docs, file_name=file_name, answer_lang=answer_lang)
+
+    async with _get_llm_semaphore():
+        with stage("llm"):
+            message = await _with_timeout("llm", (llm or get_llm()).ainvoke(prompt_txt), LLM_TIMEOUT)
+
+    return {
+        **_result_meta(query, file_name, category, add_law),
+        "answer": message.content.strip(),
+        "preview_chunks": _preview_chunks(docs, file_name),
+        "sources": _sources(docs),
+        "prompt_tokens": prompt_tokens,
+        **record_usage(message),
+    }
+
+
+async def astream_rag_search(query, file_name=None, category=None, answer_lang="ko", top_k=5, llm=None):
+    """rag_search의 스트리밍 버전. (event, payload) 튜플을 순서대로 생성한다.
+
+    - "chunks": 검색이 끝나는 즉시 preview_chunks를 먼저 보낸다 (첫 바이트 시간 = 검색 시간)
+    - "token":  LLM 토큰이 도착하는 대로 {"text": ...}
+    - "done":   rag_search 반환값과 동일한 형태의 최종 메타데이터 (answer 포함)
+
+    생성은 별도 태스크가 하고 이 제너레이터는 그 이벤트를 전달한다. 같은 질문을 동시에 스트리밍하는 요청은
+    한 생성을 함께 구독하며(LLM 호출 한 번), 늦게 합류한 요청은 지난 이벤트부터 받는다.
+    구독자가 모두 aclose() 하면 LLM 스트림도 닫혀 생성이 중단된다.
+    답변 캐시에 있으면 LLM 없이 캐시된 답변을 한 번의 token 이벤트로 보낸다.
+    같은 질문을 일반 요청(arag_search)이 생성 중이면 검색은 직접 해 chunks를 먼저 보내고 그 답변을 기다린다.
+    """
+    cache = get_answer_cache()
+    key = cache.key(query, file_name, category, answer_lang, top_k)
+    query_vector = None
+    if cache.semantic:
+        with stage("embed"):
+            query_vector = await _with_timeout("embedding", get_query_embedder().aembed(query), RETRIEVAL_TIMEOUT)
+    cached, pending, feed = cache.join_stream(
+        key,
+        lambda feed: _astream_generate(feed, query, file_name, category, answer_lang, top_k, llm, query_vector),
+        query_vector,
+    )
+    if cached is not None:
+        yield "chunks", {
+            "question": query,
+            **{k: cached[k] for k in ("file", "category", "preview_chunks", "sources")},
+        }
+        yield "token", {"text": cached["answer"]}
+        yield "done", {**cached, "question": query}
+        return
+
+    if pending is not None:
+        docs, add_law = await _aretrieve(
+            query, file_name=file_name, category=category, top_k=top_k, query_vector=query_vector
+        )
+        with stage("prompt_build"):
+            _, docs, _ = _build_prompt(query, docs, file_name=file_name, answer_lang=answer_lang)
+        yield "chunks", {
+            **_result_meta(query, file_name, category, add_law),
+            "preview_chunks": _preview_chunks(docs, file_name),
+            "sources": _sources(docs),
+        }
+        result = await asyncio.shield(pending)
+        yield "token", {"text": result["answer"]}
+        yield "done", {**result, "question": query}
+        return
+
+    queue = feed.subscribe()
+    try:
+        while True:
+            event, payload = await queue.get()
+            if event == "error":
+                raise payload
+            # 다른 요청이 시작한 생성이면 질문 문구만 이 요청의 것으로 바꾼다
+            if "question" in payload:
+                payload = {**payload, "question": query}
+            yield event, payload
+            if event == "done":
+                return
+    finally:
+        await cache.leave_stream(key, feed, queue)
+
+
+async def _astream_generate(feed, query, file_name, category, answer_lang, top_k, llm, query_vector=None) -> dict:
+    """astream_rag_search의 생성 태스크. chunks/token 이벤트를 feed로 보내고 최종 결과를 반환한다."""
+    docs, add_law = await _aretrieve(
+        query, file_name=file_name, category=category, top_k=top_k, query_vector=query_vector
+    )
+    meta = _result_meta(query, file_name, category, add_law)
+    with stage("prompt_build"):
+        prompt_txt, docs, prompt_tokens = _build_prompt(query, docs, file_name=file_name, answer_lang=answer_lang)
+    previews = _preview_chunks(docs, file_name)
+    sources = _sources(docs)
+    feed.publish("chunks", {**meta, "preview_chunks": previews, "sources": sources})
+    parts: list[str] = []
+    usage_chunk = None
+    async with _get_llm_semaphore():
+        with stage("llm"):
+            stream = (llm or get_llm()).astream(prompt_txt)
+            # 스트리밍도 arag_search와 같은 LLM_TIMEOUT을 전체 기한으로 적용한다
+            deadline = asyncio.get_running_loop().time() + LLM_TIMEOUT
+            try:
+                while True:
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(remaining, 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"llm timed out after {LLM_TIMEOUT:g}s") from None
+                    if getattr(chunk, "usage_metadata", None):
+                        usage_chunk = chunk  # 사용량은 보통 마지막 청크에 온다
+                    text = chunk.content if isinstance(chunk.content, str) else ""
+                    if not text:
+                        continue
+                    parts.append(text)
+                    feed.publish("token", {"text": text})
+            finally:
+                await stream.aclose()
+
+    return {
+        **meta,
+        "answer": "".join(parts).strip(),
+        "preview_chunks": previews,
+        "sources": sources,
+        "prompt_tokens": prompt_tokens,
+        **record_usage(usage_chunk),
+    }
+
+
+# 신뢰성(Confidence) 관련 로직은 사용되지 않아 제거되었습니다.
+
+
+def list_index_file_names(category: str | None = None, top_k: int = 1000) -> list[str]:
+    """Pinecone 벡터 인덱스에서 메타데이터의 file_name 값을 수집해 정렬된 유니크 리스트로 반환한다.
+
+    전략: 중립 쿼리로 상위 k개를 조회해 file_name을 수집한다. 인덱스 규모가 작을 때 실용적이다.
+    필요 시 k를 조정해 커버리지를 늘릴 수 있다.
+    """
+    filter_dict = {"category": category} if category else None
+    try:
+        docs = get_vectorstore().similarity_search(" ", k=top_k, filter=filter_dict)
+    except Exception:
+        # 임베딩/모델 오류 시 빈 리스트 반환
+        return []
+    names = []
+    seen = set()
+    for doc in docs:
+        name = (doc.metadata or {}).get("file_name")
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    names.sort(key=lambda x: x.lower())
+    return names
+
+
+def _iter_pinecone_metadata(index):
+    """list_paginated로 id를 페이지 단위로 받고 fetch로 메타데이터를 읽는다 (list API는 id만 반환)."""
+    ns = {"namespace": PINECONE_NAMESPACE} if PINECONE_NAMESPACE else {}
+    token = None
+    while True:
+        resp = index.list_paginated(limit=100, pagination_token=token, **ns)
+        ids = [getattr(v, "id", None) or v["id"] for v in (resp.vectors or [])]
+        if ids:
+            fetched = index.fetch(ids=ids, **ns)
+            vectors = getattr(fetched, "vectors", None)
+            if vectors is None:
+                vectors = fetched["vectors"]
+            for v in vectors.values():
+                md = getattr(v, "metadata", None)
+                if md is None and isinstance(v, dict):
+                    md = v.get("metadata")
+                yield md or {}
+        pagination = getattr(resp, "pagination", None)
+        token = getattr(pagination, "next", None) if pagination else None
+        if not token:
+            break
+
+
+@stage("catalog_scan")
+def scan_index_catalog() -> dict[str, dict]:
+    """인덱스 전체를 순회해 file_name별 category/페이지 수/청크 수를 모은다.
+
+    비용이 크므로 카탈로그 파일이 없을 때 백그라운드 초기화에만 쓴다.
+    """
+    from .catalog import summarize
+
+    if VECTOR_BACKEND == "local":
+        return summarize(get_vectorstore().iter_metadata())
+    if Pinecone is None or not PINECONE_API_KEY or not PINECONE_INDEX:
+        return {}
+    index = Pinecone(api_key=PINECONE_API_KEY).Index(PINECONE_INDEX)
+    return summarize(_iter_pinecone_metadata(index))
+
+
+@stage("list_files")
+def list_all_file_names(category: str | None = None) -> list[str]:
+    """인덱스 전체를 순회해 file_name을 수집한다 (category가 주어지면 해당 카테고리만).
+    실패 시 list_index_file_names로 폴백한다. 서비스 경로는 catalog.get_catalog()를 쓴다.
+    """
+    if VECTOR_BACKEND == "local":
+        names = get_vectorstore().values("file_name", filter={"category": category} if category else None)
+        return sorted(names, key=lambda x: x.lower())
+    if Pinecone is None or not PINECONE_API_KEY or not PINECONE_INDEX:
+        return list_index_file_names(category=category, top_k=2000)
+    try:
+        entries = scan_index_catalog()
+        names = [n for n, e in entries.items() if not category or e.get("category") == category]
+        return sorted(names, key=lambda x: x.lower())
+    except Exception:
+        # 어떤 이유로든 실패하면 샘플링 폴백
+        return list_index_file_names(category=category, top_k=5000)
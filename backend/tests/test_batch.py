@@ -0,0 +1,115 @@
+# backend/tests/test_batch.py
+"""abatch_rag_search 오프라인 테스트 (스텁 임베딩/벡터 저장소/LLM).
+
+실행: python -m pytest -q backend/tests
+"""
+import asyncio
+
+import pytest
+
+from backend import rag
+from backend.answer_cache import AnswerCache
+from backend.batch import abatch_rag_search
+from backend.embedding_cache import QueryEmbeddingCache
+from backend.loadtest import StubChatModel, StubEmbeddings, StubVectorStore
+
+
+class BatchEmbeddings(StubEmbeddings):
+    """aembed_documents를 지원하고 호출을 센다. fail=True면 일괄 임베딩만 실패한다."""
+
+    def __init__(self, fail: bool = False):
+        super().__init__(0.0)
+        self.fail = fail
+        self.batches: list[list[str]] = []
+        self.singles: list[str] = []
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise ValueError("batch embedding unavailable")
+        return [[0.0] * self.dim for _ in texts]
+
+    async def aembed_query(self, text):
+        self.singles.append(text)
+        return await super().aembed_query(text)
+
+
+class FailingChatModel(StubChatModel):
+    """프롬프트에 marker가 들어간 질문만 실패한다."""
+
+    def __init__(self, marker: str):
+        super().__init__(0.0)
+        self.marker = marker
+        self.calls = 0
+
+    async def ainvoke(self, prompt_txt):
+        self.calls += 1
+        if self.marker in prompt_txt:
+            raise ValueError("model refused")
+        return await super().ainvoke(prompt_txt)
+
+
+def _stub_backends(monkeypatch, embeddings):
+    store = StubVectorStore(0.0)
+    embedder = QueryEmbeddingCache(embeddings, model="stub")
+    answer_cache = AnswerCache(max_entries=0)
+    monkeypatch.setattr(rag, "RETRIEVAL_MODE", "vector")
+    monkeypatch.setattr(rag, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(rag, "get_query_embedder", lambda: embedder)
+    monkeypatch.setattr(rag, "get_answer_cache", lambda: answer_cache)
+
+
+def _run(questions, llm, **kwargs) -> dict[int, dict]:
+    async def main():
+        return [item async for item in abatch_rag_search(questions, file_name="JOA.pdf", llm=llm, **kwargs)]
+
+    items = asyncio.run(main())
+    by_index = {item["index"]: item for item in items}
+    assert len(by_index) == len(items) == len(questions)
+    return by_index
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = BatchEmbeddings()
+    _stub_backends(monkeypatch, embeddings)
+    return embeddings
+
+
+def test_blank_questions_keep_their_position(embeddings):
+    questions = ["Force Majeure 조건은?", "", "   ", "AFE 승인 한도는?"]
+    items = _run(questions, StubChatModel(0.0))
+    assert [items[i]["error_type"] for i in (1, 2)] == ["ValueError", "ValueError"]
+    assert items[2]["question"] == "   "
+    assert "answer" in items[0] and "answer" in items[3]
+    assert items[3]["question"] == "AFE 승인 한도는?"
+
+
+def test_duplicate_questions_fan_out_to_every_index(embeddings):
+    llm = FailingChatModel(marker="never")
+    questions = ["Force Majeure 조건은?", "AFE 승인 한도는?", "force majeure  조건은?", "Force Majeure 조건은?"]
+    items = _run(questions, llm)
+    # 정규화하면 같은 질문 세 개는 한 번만 검색/생성한다
+    assert llm.calls == 2
+    assert embeddings.batches == [["Force Majeure 조건은?", "AFE 승인 한도는?"]]
+    for i in (0, 2, 3):
+        assert items[i]["question"] == questions[i]
+        assert items[i]["answer"] == items[0]["answer"]
+
+
+def test_failing_question_is_reported_on_its_own_item(embeddings):
+    questions = ["Force Majeure 조건은?", "boom 질문", "AFE 승인 한도는?"]
+    items = _run(questions, FailingChatModel(marker="boom"), max_retries=0)
+    assert items[1]["error"] == "model refused" and items[1]["error_type"] == "ValueError"
+    assert "answer" not in items[1]
+    assert "error" not in items[0] and "error" not in items[2]
+
+
+def test_batch_embedding_failure_falls_back_to_per_question(monkeypatch):
+    embeddings = BatchEmbeddings(fail=True)
+    _stub_backends(monkeypatch, embeddings)
+    questions = ["Force Majeure 조건은?", "AFE 승인 한도는?", "Force Majeure 조건은?"]
+    items = _run(questions, StubChatModel(0.0), max_retries=0)
+    assert len(embeddings.batches) == 1
+    assert sorted(embeddings.singles) == sorted(set(questions))
+    assert all("answer" in item for item in items.values())
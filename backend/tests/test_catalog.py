@@ -0,0 +1,34 @@
+# backend/tests/test_catalog.py
+"""카탈로그 부트스트랩(인덱스 스캔으로 처음 채우기) 테스트.
+
+실행: python -m pytest -q backend/tests
+"""
+import threading
+
+from backend.catalog import DocumentCatalog, start_refresher
+
+ENTRY = {"category": "contract", "page_count": 3, "chunk_count": 9, "fingerprint": "scan:3:9"}
+
+
+def _bootstrap_once(catalog: DocumentCatalog, entries: dict) -> None:
+    # 부트스트랩 후 stop을 set하면 갱신 스레드가 바로 끝나므로 join으로 기다린다
+    stop = start_refresher(catalog, 60.0, bootstrap=lambda: entries)
+    stop.set()
+    for thread in threading.enumerate():
+        if thread.name == "catalog-refresh":
+            thread.join(5)
+
+
+def test_empty_scan_does_not_write_catalog(tmp_path):
+    path = tmp_path / "catalog.json"
+    catalog = DocumentCatalog(str(path))
+    _bootstrap_once(catalog, {})
+    assert len(catalog) == 0
+    assert not path.exists()
+
+
+def test_scan_result_is_saved(tmp_path):
+    path = tmp_path / "catalog.json"
+    catalog = DocumentCatalog(str(path))
+    _bootstrap_once(catalog, {"JOA.pdf": ENTRY})
+    assert DocumentCatalog(str(path)).entries() == {"JOA.pdf": ENTRY}
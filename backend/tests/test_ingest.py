@@ -0,0 +1,117 @@
+# backend/tests/test_ingest.py
+"""청크 길이 상한과 증분 적재(바뀐 페이지만 다시 임베딩) 테스트.
+
+PDF 추출은 가짜 페이지로 대체하고, 로컬 인덱스와 해싱 임베딩을 임시 디렉터리에 둔다.
+실행: python -m pytest -q backend/tests
+"""
+import json
+import random
+
+import pytest
+
+from backend import ingest, rag
+from backend.answer_cache import AnswerCache
+from backend.benchmark import HashingEmbeddings
+from backend.catalog import DocumentCatalog
+from backend.local_index import LocalVectorIndex
+
+WORDS = ["Operator", "shall", "notify", "the", "Parties", "within", "fourteen", "days", "of", "any",
+         "Force", "Majeure", "event", "계약", "당사자는", "통지한다", "AFE", "approval", "Non-Operator"]
+
+
+def _synthetic_page(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(1, 12)):
+        head = rng.choice(["", "ARTICLE %d " % rng.randint(1, 30), "%d.%d " % (rng.randint(1, 30), rng.randint(1, 9)),
+                           "제%d조 " % rng.randint(1, 30)])
+        # 공백 없이 긴 토큰(표, URL 등)도 섞는다
+        body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 400)))
+        if rng.random() < 0.2:
+            body += " " + "x" * rng.randint(1, 3000)
+        lines.append(head + body)
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("max_chars,overlap", [(1200, 200), (300, 120), (80, 60)])
+def test_chunks_never_exceed_max_chars(max_chars, overlap):
+    rng = random.Random(max_chars)
+    for _ in range(300):
+        text = _synthetic_page(rng)
+        chunks = ingest.chunk_text(text, max_chars=max_chars, overlap=overlap)
+        assert all(len(chunk) <= max_chars for chunk in chunks)
+        if text.strip():
+            assert chunks
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    pages = {"JOA.pdf": {}}
+    monkeypatch.setattr(
+        ingest, "extract_pages", lambda paths, workers: {p: sorted(pages[p].items()) for p in paths}
+    )
+    answer_cache = AnswerCache()
+    monkeypatch.setattr(rag, "get_answer_cache", lambda: answer_cache)
+    embeddings = CountingEmbeddings()
+    store = LocalVectorIndex(str(tmp_path / "index"))
+
+    def run():
+        embeddings.embedded.clear()
+        return ingest.ingest(
+            ["JOA.pdf"], workers=1, store=store, embeddings=embeddings,
+            state_path=str(tmp_path / "ingest_state.json"),
+            catalog=DocumentCatalog(str(tmp_path / "catalog.json")),
+            chunk_store_path=str(tmp_path / "chunks.json"),
+        )
+
+    def page_chunk_ids(page_num: int) -> list[str]:
+        state = json.loads((tmp_path / "ingest_state.json").read_text(encoding="utf-8"))
+        return state["files"]["JOA.pdf"]["pages"][str(page_num)]["chunk_ids"]
+
+    rng = random.Random(7)
+    for page_num in range(1, 6):
+        pages["JOA.pdf"][page_num] = _synthetic_page(rng) + f"\nPage marker {page_num}"
+    return pages["JOA.pdf"], store, embeddings, run, page_chunk_ids, tmp_path
+
+
+def test_second_ingest_embeds_nothing(workspace):
+    _, store, embeddings, run, _, _ = workspace
+    first = run()
+    assert first["chunks_embedded"] == len(embeddings.embedded) > 0
+    size = len(store)
+
+    second = run()
+    assert (second["pages_changed"], second["chunks_embedded"], second["chunks_deleted"]) == (0, 0, 0)
+    assert embeddings.embedded == []
+    assert len(store) == size
+
+
+def test_changed_page_re_embeds_only_that_page(workspace):
+    pages, store, embeddings, run, page_chunk_ids, tmp_path = workspace
+    run()
+    old_ids = page_chunk_ids(3)
+    untouched = {n: page_chunk_ids(n) for n in pages if n != 3}
+
+    pages[3] = "ARTICLE 9 REVISED\nThe Operator shall notify the Parties within seven days."
+    report = run()
+    new_ids = page_chunk_ids(3)
+    assert report["pages_changed"] == 1
+    assert report["chunks_embedded"] == len(new_ids) == len(embeddings.embedded)
+    assert embeddings.embedded == [pages[3]]
+    assert report["chunks_deleted"] == len(old_ids)
+    # 이전 청크는 벡터 저장소와 청크 저장소 양쪽에서 지워진다
+    chunk_store = json.loads((tmp_path / "chunks.json").read_text(encoding="utf-8"))
+    for chunk_id in old_ids:
+        assert chunk_id not in store._row_of and chunk_id not in chunk_store
+    for chunk_id in new_ids:
+        assert chunk_id in store._row_of and chunk_id in chunk_store
+    assert {n: page_chunk_ids(n) for n in pages if n != 3} == untouched
@@ -0,0 +1,58 @@
+# backend/tests/test_lexical.py
+"""조항 번호 직접 조회(find_clause)와 하이브리드 검색으로의 전환 테스트.
+
+실행: python -m pytest -q backend/tests
+"""
+import asyncio
+import json
+
+import pytest
+
+from backend import rag
+from backend.embedding_cache import QueryEmbeddingCache
+from backend.lexical import LexicalIndex
+from backend.loadtest import StubEmbeddings, StubVectorStore
+
+CHUNKS = {
+    "joa-p1-0": {"text": "ARTICLE 4 NOTICES\nThe Operator shall notify the Parties within\n5 days of the event.",
+                 "file_name": "JOA.pdf", "page_num": 1},
+    "joa-p2-0": {"text": "Late payments bear interest at\n5% per annum until paid.",
+                 "file_name": "JOA.pdf", "page_num": 2},
+    "joa-p3-0": {"text": "ARTICLE 7 DEFAULT\nA Party in default under Article 12.3 loses its vote.",
+                 "file_name": "JOA.pdf", "page_num": 3},
+    "joa-p4-0": {"text": "12.3 Default Notice\nThe Operator shall give notice of default.",
+                 "file_name": "JOA.pdf", "page_num": 4},
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "chunks.json"
+    path.write_text(json.dumps(CHUNKS), encoding="utf-8")
+    return LexicalIndex(str(path))
+
+
+def test_heading_hit_comes_first(index):
+    docs = index.find_clause("12.3", "JOA.pdf")
+    assert [doc.id for doc in docs] == ["joa-p4-0", "joa-p3-0"]
+
+
+def test_number_only_in_body_text_is_not_a_clause(index):
+    # "within 5 days", "5% per annum"에는 5조가 없다
+    assert index.find_clause("5", "JOA.pdf") == []
+
+
+def test_clause_miss_falls_through_to_hybrid_retrieval(index, monkeypatch):
+    embeddings = StubEmbeddings(0.0)
+    monkeypatch.setattr(rag, "RETRIEVAL_MODE", "hybrid")
+    monkeypatch.setattr(rag, "get_lexical_index", lambda: index)
+    monkeypatch.setattr(rag, "get_vectorstore", lambda: StubVectorStore(0.0))
+    monkeypatch.setattr(rag, "get_query_embedder", lambda: QueryEmbeddingCache(embeddings, model="stub"))
+
+    for query in ("Article 5", "Section 5 보여줘", "5"):
+        docs, _ = asyncio.run(rag._aretrieve(query, file_name="JOA.pdf"))
+        # 벡터 검색 결과(Stub clause)가 섞여 있으면 fast path를 타지 않은 것이다
+        assert any(doc.page_content.startswith("Stub clause") for doc in docs), query
+
+    docs, _ = asyncio.run(rag._aretrieve("Article 12.3", file_name="JOA.pdf"))
+    assert [doc.id for doc in docs] == ["joa-p4-0", "joa-p3-0"]
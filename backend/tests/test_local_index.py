@@ -0,0 +1,71 @@
+# backend/tests/test_local_index.py
+"""LocalVectorIndex 비동기 검색이 큰 점수 계산을 이벤트 루프 밖에서 하는지 테스트.
+
+실행: python -m pytest -q backend/tests
+"""
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from backend.local_index import LocalVectorIndex
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 40
+    store = LocalVectorIndex(str(tmp_path / "index"))
+    store.upsert(
+        [f"c{i}" for i in range(n)],
+        rng.standard_normal((n, 16)).astype(np.float32),
+        [f"chunk {i}" for i in range(n)],
+        [{"file_name": f"f{i % 4}.pdf", "category": "contract", "page_num": i} for i in range(n)],
+    )
+    store.save()
+    return store
+
+
+def _score_threads(store, monkeypatch) -> list[int]:
+    threads = []
+    score = store._score
+
+    def recording_score(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return score(*args, **kwargs)
+
+    monkeypatch.setattr(store, "_score", recording_score)
+    return threads
+
+
+def test_unfiltered_search_scores_off_the_loop(store, monkeypatch):
+    query = np.ones(16).tolist()
+    expected = [doc.id for doc in store.similarity_search_by_vector(query, k=5)]
+    threads = _score_threads(store, monkeypatch)
+
+    async def main():
+        return threading.get_ident(), await store.asimilarity_search_by_vector(query, k=5)
+
+    loop_thread, docs = asyncio.run(main())
+    assert [doc.id for doc in docs] == expected
+    assert threads and threads[0] != loop_thread
+
+
+def test_small_filtered_search_scores_inline(store, monkeypatch):
+    query = np.ones(16).tolist()
+    expected = [doc.id for doc in store.similarity_search_by_vector(query, k=3, filter={"file_name": "f1.pdf"})]
+    threads = _score_threads(store, monkeypatch)
+
+    async def main():
+        return threading.get_ident(), await store.asimilarity_search_by_vector(query, k=3, filter={"file_name": "f1.pdf"})
+
+    loop_thread, docs = asyncio.run(main())
+    assert [doc.id for doc in docs] == expected
+    assert threads == [loop_thread]
+
+    # 후보가 상한을 넘으면 필터 검색도 스레드에서 계산한다
+    monkeypatch.setattr(store, "INLINE_SCORE_MAX", 16)
+    threads.clear()
+    loop_thread, _ = asyncio.run(main())
+    assert threads and threads[0] != loop_thread
@@ -0,0 +1,142 @@
+# backend/tests/test_stream.py
+"""astream_rag_search 오프라인 테스트 (가짜 스트리밍 모델, 스텁 임베딩/벡터 저장소).
+
+실행: python -m pytest -q backend/tests
+"""
+import asyncio
+import itertools
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from backend import rag
+from backend.answer_cache import AnswerCache
+from backend.embedding_cache import QueryEmbeddingCache
+from backend.loadtest import StubEmbeddings, StubVectorStore
+
+ANSWER = "【답변 요약】 Force Majeure notice within fourteen days (JOA.pdf, p.1)"
+
+
+class FakeStreamingModel(GenericFakeChatModel):
+    """토큰 사이에 delay만큼 쉬며 스트리밍하고, 스트림을 연 횟수와 닫힌 횟수를 센다."""
+
+    delay: float = 0.01
+    streams: int = 0
+    closed: int = 0
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.streams += 1
+        try:
+            for chunk in self._stream(messages, stop=stop, **kwargs):
+                await asyncio.sleep(self.delay)
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+@pytest.fixture
+def model():
+    return FakeStreamingModel(messages=itertools.cycle([AIMessage(content=ANSWER)]))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    store = StubVectorStore(0.0)
+    embedder = QueryEmbeddingCache(StubEmbeddings(0.0), model="stub")
+    answer_cache = AnswerCache()
+    monkeypatch.setattr(rag, "RETRIEVAL_MODE", "vector")
+    monkeypatch.setattr(rag, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(rag, "get_query_embedder", lambda: embedder)
+    monkeypatch.setattr(rag, "get_answer_cache", lambda: answer_cache)
+    return answer_cache
+
+
+async def _collect(model, query="Force Majeure 조건은?", stop_after=None):
+    events = []
+    stream = rag.astream_rag_search(query, file_name="JOA.pdf", llm=model)
+    try:
+        async for event, payload in stream:
+            events.append((event, payload))
+            if stop_after and len(events) >= stop_after:
+                break
+    finally:
+        await stream.aclose()
+    return events
+
+
+def test_events_arrive_as_chunks_tokens_done(cache, model):
+    events = asyncio.run(_collect(model))
+    names = [event for event, _ in events]
+    assert names[0] == "chunks"
+    assert names[-1] == "done"
+    assert set(names[1:-1]) == {"token"} and len(names) > 3
+    assert events[0][1]["preview_chunks"]
+    done = events[-1][1]
+    assert done["answer"] == "".join(p["text"] for e, p in events if e == "token").strip() == ANSWER
+    assert done["question"] == "Force Majeure 조건은?"
+
+
+def test_aclose_closes_llm_stream(cache, model):
+    events = asyncio.run(_collect(model, stop_after=2))
+    assert [event for event, _ in events] == ["chunks", "token"]
+    assert model.streams == model.closed == 1
+    # 끝나지 않은 생성은 캐시에 남기지 않는다
+    assert cache.stats()["size"] == 0
+
+
+def test_identical_concurrent_streams_coalesce(cache, model):
+    async def main():
+        leader = asyncio.ensure_future(_collect(model))
+        await asyncio.sleep(model.delay * 3)  # 리더가 토큰을 보내기 시작한 뒤 합류
+        followers = await asyncio.gather(*(_collect(model, query="force majeure  조건은") for _ in range(3)))
+        return await leader, followers
+
+    leader, followers = asyncio.run(main())
+    assert model.streams == 1
+    tokens = [p["text"] for e, p in leader if e == "token"]
+    for events in followers:
+        assert [e for e, _ in events][0] == "chunks"
+        assert [p["text"] for e, p in events if e == "token"] == tokens
+        assert events[-1][1]["question"] == "force majeure  조건은"
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 3)
+
+
+def test_follower_keeps_streaming_when_leader_disconnects(cache, model):
+    async def follow():
+        await asyncio.sleep(model.delay / 2)  # 리더가 첫 토큰을 받기 전에 합류
+        return await _collect(model)
+
+    async def main():
+        return await asyncio.gather(_collect(model, stop_after=2), follow())
+
+    leader, follower = asyncio.run(main())
+    assert [e for e, _ in leader] == ["chunks", "token"]
+    assert follower[-1][0] == "done" and follower[-1][1]["answer"] == ANSWER
+    assert model.streams == 1
+
+
+def test_waiters_retry_after_stream_abandoned(cache, model):
+    async def main():
+        stream = rag.astream_rag_search("Force Majeure 조건은?", file_name="JOA.pdf", llm=model)
+        assert (await stream.__anext__())[0] == "chunks"
+        # 같은 질문의 일반 요청은 진행 중인 스트림의 결과를 기다린다
+        waiter = asyncio.ensure_future(rag.arag_search("Force Majeure 조건은?", file_name="JOA.pdf", llm=model))
+        await asyncio.sleep(0)
+        await stream.aclose()
+        return await waiter
+
+    result = asyncio.run(main())
+    assert model.closed == 1
+    # 스트림이 중단되자 StreamAbandoned를 받고 직접 생성했다
+    assert result["answer"] == ANSWER
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_streams_on_separate_event_loops(cache, model, monkeypatch):
+    # LLM 동시 호출 세마포어가 첫 이벤트 루프에 묶이지 않아야 한다
+    monkeypatch.setattr(rag, "LLM_MAX_CONCURRENCY", 1)
+    for query in ("first question", "second question"):
+        events = asyncio.run(_collect(model, query=query))
+        assert events[-1][0] == "done"